@@ -0,0 +1,76 @@
+"""Import-time benchmark and guard for the obvibe modules.
+
+Each module is imported in a fresh interpreter, several times, and the best wall time is reported together with
+the heavy dependencies the import pulled in. The script exits with status 1 if a light module imports one of the
+heavy dependencies or takes longer than `--max-seconds`, so it can run as a regression check.
+
+Usage:
+    python benchmarks/bench_import.py --repeat 5 --max-seconds 0.5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+HEAVY = ["pybis", "pandas", "numpy", "openpyxl", "requests"]
+
+# Modules that must import without the heavy dependencies.
+LIGHT_MODULES = [
+    "obvibe.pathfolio",
+    "obvibe.manifest",
+    "obvibe.instrumentation",
+    "obvibe.streaming",
+    "obvibe.oh_my_ontology",
+    "obvibe.vibing",
+    "obvibe.watcher",
+    "obvibe.batch_jsonld",
+]
+# Modules that need them anyway, measured for reference only.
+HEAVY_MODULES = ["obvibe.keller", "obvibe.simon_simulator"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    """Import `module` in `repeat` fresh interpreters and return the best time and the heavy modules loaded."""
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+            capture_output=True, text=True, check=True,
+        )
+        runs.append(json.loads(out.stdout))
+    return {"module": module, "seconds": min(r["seconds"] for r in runs), "heavy": runs[0]["heavy"]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module, the best run counts")
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="Import time budget of the light modules")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<26}{'best s':>9}  heavy dependencies")
+    for module in LIGHT_MODULES + HEAVY_MODULES:
+        result = measure(module, args.repeat)
+        print(f"{module:<26}{result['seconds']:>9.3f}  {', '.join(result['heavy']) or '-'}")
+        if module in LIGHT_MODULES:
+            if result["heavy"]:
+                failures.append(f"{module} imports {', '.join(result['heavy'])}")
+            if result["seconds"] > args.max_seconds:
+                failures.append(f"{module} took {result['seconds']:.3f} s > {args.max_seconds} s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
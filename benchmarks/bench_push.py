@@ -0,0 +1,215 @@
+"""End-to-end benchmark of `vibing.push_exp` and `vibing.push_many` against a local fake openBIS.
+
+Synthetic experiment folders with an analyzed JSON file, a raw `full.*.h5` file and a custom metadata Excel file are
+generated in a temporary directory, together with a BattINFO-like template. Each scenario is pushed to a
+`fake_openbis.FakeOpenbis` with the given latency and bandwidth, and the wall time, round trips and bytes sent per
+experiment are reported. The "update no-op" scenario pushes a folder and then updates it with `vibing.update_exp`
+without changing anything, which must cost exactly one `getExperiments` call.
+
+Usage:
+    python benchmarks/bench_push.py --folders 8 --raw-mb 50 --latency 0.05 --bandwidth-mb 100
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from openpyxl import Workbook
+
+from obvibe import fake_openbis, pathfolio, vibing
+
+UNITS = {"(mm)": "mm", "(mAh)": "mAh", "(g)": "g", "(V)": "V"}
+
+
+def make_template(path: Path, n_rows: int = 400) -> Path:
+    """Write a BattINFO-like template with the metadata rows obvibe fills and `n_rows` further rows."""
+    wb = Workbook()
+    schema = wb.active
+    schema.title = "Schema"
+    schema.append(["Metadata", "Value", "Unit", "Ontology link"])
+    schema.append(["BattINFO CoinCellSchema version", "1.0", "No Unit", "NotOntologize"])
+    schema.append(["Cell type", "CoinCell", "No Unit", "NotOntologize"])
+    schema.append(["Institution/company", "Empa", "No Unit", "schema:manufacturer"])
+    schema.append(["Scientist/technician/operator", None, "No Unit", "schema:author"])
+    schema.append(["Date of cell assembly", None, "No Unit", "schema:dateCreated"])
+    for i, (metadata, json_key) in enumerate(pathfolio.dict_excel_to_json.items()):
+        unit = next((u for suffix, u in UNITS.items() if json_key.endswith(suffix)), "No Unit")
+        schema.append([metadata, None, unit, f"hasComponent{i % 5}-hasProperty-Property{i}"])
+    for i in range(n_rows):
+        unit = "mm" if i % 3 == 0 else "No Unit"
+        schema.append([f"Template property {i}", f"value {i}", unit, f"hasComponent{i % 5}-hasProperty-Template{i}"])
+
+    units = wb.create_sheet("Ontology - Unit")
+    units.append(["Item", "Key"])
+    for unit in ["mm", "mAh", "g", "V"]:
+        units.append([unit, f"emmo:{unit}"])
+    top_level = wb.create_sheet("@context-TopLevel")
+    top_level.append(["Item", "Key"])
+    top_level.append(["schema", "https://schema.org/"])
+    connectors = wb.create_sheet("@context-Connector")
+    connectors.append(["Item", "Key"])
+    for i in range(5):
+        connectors.append([f"hasComponent{i}", f"Component{i}"])
+    connectors.append(["hasProperty", None])
+    unique_id = wb.create_sheet("Unique ID")
+    unique_id.append(["Item", "ID"])
+    unique_id.append(["Empa", "https://ror.org/02x681a42"])
+    unique_id.append(["Empa Dübendorf", "https://ror.org/02x681a42"])
+    unique_id.append(["bench", "https://orcid.org/0000-0000-0000-0000"])
+    wb.save(path)
+    return path
+
+
+def make_experiment_folder(root: Path, index: int, json_mb: float, raw_mb: float) -> Path:
+    """Write a synthetic experiment folder and return its path."""
+    experiment_code = f"240906_bench_gen4_{index:02d}"
+    folder = root / experiment_code
+    folder.mkdir(parents=True)
+
+    rng = random.Random(index)
+    sample_data = {j["metadata"]: rng.random() if j["type"] == "REAL" else f"value {rng.randrange(100)}"
+                   for j in pathfolio.premise3_collection}
+    sample_data.update({
+        "Sample ID": experiment_code,
+        "Run ID": experiment_code.rsplit("_", 1)[0],
+        "Timestamp step 10": (datetime(2024, 9, 6) + timedelta(hours=index)).strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    # Cycling data large enough to give the analyzed file the requested size.
+    n_points = max(1, int(json_mb * 1024 * 1024 / 60))
+    data = {
+        "Cycle": list(range(n_points)),
+        "Discharge capacity (mAh)": [round(rng.random(), 6) for _ in range(n_points)],
+        "Efficiency (%)": [round(99 + rng.random(), 6) for _ in range(n_points)],
+    }
+    with (folder / f"cycle.{experiment_code}.json").open("w") as f:
+        json.dump({"data": data, "metadata": {"sample_data": sample_data}}, f)
+    with (folder / f"full.{experiment_code}.h5").open("wb") as f:
+        remaining = int(raw_mb * 1024 * 1024)
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+
+    custom = Workbook()
+    sheet = custom.active
+    sheet.title = "Schema"
+    sheet.append(["Metadata", "Value", "Unit", "Ontology link"])
+    sheet.append(["Institution/company", "Empa Dübendorf", "No Unit", "schema:manufacturer"])
+    custom.save(folder / f"{experiment_code}_custom_metadata.xlsx")
+    return folder
+
+
+def run_scenario(
+        name: str,
+        ob: fake_openbis.FakeOpenbis,
+        folders: list[Path],
+        use_async: bool = False,
+        update: bool = False,
+        **kwargs: dict,
+) -> dict:
+    """Push the folders to a fresh fake openBIS session and return the measurements.
+
+    If `update` is True, the folder is pushed first and only a following `update_exp` of it is measured.
+    """
+    if update:
+        with contextlib.redirect_stdout(io.StringIO()):
+            vibing.push_exp("", folders[0], openbis_obj=ob, **kwargs)
+    ob.reset_calls()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if update:
+            result = vibing.update_exp("", folders[0], openbis_obj=ob, **kwargs)
+            errors = []
+            metrics = [result.metrics]
+        elif use_async:
+            reports = asyncio.run(vibing.push_many_async("", folders, openbis_obj=ob, resume=False, **kwargs))
+            errors = [report.failure for report in reports if not report.ok]
+            metrics = [report.metrics for report in reports]
+        elif len(folders) == 1:
+            result = vibing.push_exp("", folders[0], openbis_obj=ob, resume=False, **kwargs)
+            errors = []
+            metrics = [result.metrics]
+        else:
+            reports = vibing.push_many("", folders, openbis_obj=ob, resume=False, **kwargs)
+            errors = [report.failure for report in reports if not report.ok]
+            metrics = [report.metrics for report in reports]
+    wall_time = time.perf_counter() - start
+    if errors:
+        msg = f"{name}: {errors[0]}"
+        raise RuntimeError(msg)
+    stats = ob.stats()
+    if update and stats.by_method != {"getExperiments": 1}:
+        msg = f"{name}: an update without changes made the calls {stats.by_method}, expected one getExperiments"
+        raise RuntimeError(msg)
+    n = len(folders)
+    stage_seconds = {}
+    for m in metrics:
+        for stage_name, stage_metrics in m.stages.items():
+            stage_seconds[stage_name] = stage_seconds.get(stage_name, 0.0) + stage_metrics.duration / n
+    return {
+        "scenario": name,
+        "experiments": n,
+        "wall_s": wall_time,
+        "wall_s_per_exp": wall_time / n,
+        "round_trips_per_exp": stats.round_trips / n,
+        "mb_sent_per_exp": stats.bytes_sent / n / 1024 / 1024,
+        "network_s": stats.network_time,
+        "by_method": stats.by_method,
+        "stage_s_per_exp": stage_seconds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folders", type=int, default=4, help="Number of folders of the multi-folder push")
+    parser.add_argument("--json-mb", type=float, default=2.0, help="Size of each analyzed JSON file in MB")
+    parser.add_argument("--raw-mb", type=float, default=20.0, help="Size of each raw HDF5 file in MB")
+    parser.add_argument("--template-rows", type=int, default=400, help="Additional rows of the template schema")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per round trip")
+    parser.add_argument("--bandwidth-mb", type=float, default=100.0, help="Upload bandwidth in MB/s, 0 = unlimited")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent folders of the multi-folder push")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON lines")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="obvibe_bench_") as tmp:
+        root = Path(tmp)
+        dir_template = str(make_template(root / "Battinfo_template.xlsx", args.template_rows))
+        folders = [make_experiment_folder(root, i, args.json_mb, args.raw_mb) for i in range(args.folders)]
+
+        def new_ob() -> fake_openbis.FakeOpenbis:
+            bandwidth = args.bandwidth_mb * 1024 * 1024 if args.bandwidth_mb else None
+            return fake_openbis.FakeOpenbis(latency=args.latency, bandwidth=bandwidth)
+
+        common = {"dir_template": dir_template}
+        results = [
+            run_scenario("single", new_ob(), folders[:1], **common),
+            run_scenario("single pipelined", new_ob(), folders[:1], pipelined=True, **common),
+            run_scenario("single streamed", new_ob(), folders[:1], stream_threshold=1024 * 1024, **common),
+            run_scenario("many", new_ob(), folders, max_workers=args.workers, **common),
+            run_scenario("many pipelined", new_ob(), folders, max_workers=args.workers, pipelined=True, **common),
+            run_scenario("many async", new_ob(), folders, use_async=True, max_connections=args.workers, **common),
+            run_scenario("update no-op", new_ob(), folders[:1], update=True, **common),
+        ]
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    print(f"{'scenario':<18}{'exps':>6}{'wall s':>10}{'s/exp':>10}{'trips/exp':>11}{'MB/exp':>10}")
+    for r in results:
+        print(
+            f"{r['scenario']:<18}{r['experiments']:>6}{r['wall_s']:>10.2f}{r['wall_s_per_exp']:>10.2f}"
+            f"{r['round_trips_per_exp']:>11.1f}{r['mb_sent_per_exp']:>10.2f}",
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Incremental reading of the analyzed `cycle.<experiment>.json` files.
+
+The analyzed files carry the full per-cycle data next to a small metadata block. `read_sample_data` extracts
+`["metadata"]["sample_data"]` without parsing the rest: the file is memory-mapped and scanned for the structural
+characters with `bytes.find`, which skips over the numeric arrays in C. Values off the path to the sample data are
+skipped as a whole, only the sample data block itself is decoded, and the scan stops as soon as it is complete.
+"""
+
+import json
+import mmap
+import re
+from pathlib import Path
+
+_WHITESPACE = re.compile(rb"\s*")
+_SCALAR_END = re.compile(rb"[^,}\]\s]*")
+
+_QUOTE, _OPEN_OBJECT, _CLOSE_OBJECT, _OPEN_ARRAY, _CLOSE_ARRAY = b'"{}[]'
+_OPENING = {_OPEN_OBJECT, _OPEN_ARRAY}
+
+
+class _StructureScanner:
+    """Find the next structural character of a JSON document.
+
+    The next occurrence of every structural character is located with `bytes.find`, which runs at memchr speed, and
+    only searched again once the scan has passed it.
+    """
+
+    def __init__(self, buf: mmap.mmap) -> None:
+        self.buf = buf
+        self.size = len(buf)
+        self.next_at = dict.fromkeys((b'"', b"{", b"}", b"[", b"]"), -1)
+
+    def search(self, pos: int) -> int | None:
+        """Get the offset of the first structural character at or after `pos`, or None at the end."""
+        next_at = self.next_at
+        for char, at in next_at.items():
+            if at < pos:
+                found = self.buf.find(char, pos)
+                next_at[char] = found if found != -1 else self.size
+        first = min(next_at.values())
+        return first if first < self.size else None
+
+    def string_end(self, pos: int) -> int:
+        """Get the offset after the closing quote of the string whose content starts at `pos`."""
+        while True:
+            quote = self.buf.find(b'"', pos)
+            if quote == -1:
+                msg = "Unterminated string in the JSON file"
+                raise ValueError(msg)
+            backslashes = 0
+            while self.buf[quote - 1 - backslashes] == b"\\"[0]:
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return quote + 1
+            pos = quote + 1
+
+
+def read_sample_data(dir_json: str | Path, path: tuple[str, ...] = ("metadata", "sample_data")) -> dict:
+    """Read the sample data section of an analyzed JSON file without loading the cycling data.
+
+    Equivalent to `json.load(f)["metadata"]["sample_data"]`, except that the parts of the file outside of the
+    requested section are only scanned for their structure, not validated or decoded.
+
+    Args:
+        dir_json (str | Path): The path to the analyzed JSON file.
+        path (tuple[str, ...], optional): The keys leading to the section, from the top-level object.
+            Defaults to ("metadata", "sample_data").
+
+    Returns:
+        dict: The decoded section.
+
+    Raises:
+        KeyError: If the file has no such section.
+
+    """
+    with Path(dir_json).open("rb") as f:
+        if Path(dir_json).stat().st_size == 0:
+            # mmap cannot map an empty file, let json report the error.
+            return _get_path(json.load(f), path)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            start, end = _find_value(buf, path)
+            return json.loads(buf[start:end])
+
+
+def _get_path(content: dict, path: tuple[str, ...]) -> dict:
+    for key in path:
+        content = content[key]
+    return content
+
+
+def _find_value(buf: mmap.mmap, path: tuple[str, ...]) -> tuple[int, int]:
+    """Get the start and end offsets of the value at `path` in a JSON document."""
+    scanner = _StructureScanner(buf)
+    # The opening byte of each open container. Only the containers along the path are entered, the others are
+    # skipped as a whole.
+    containers = []
+    pos = 0
+    while (at := scanner.search(pos)) is not None:
+        char = buf[at]
+        pos = at + 1
+        if char == _QUOTE:
+            string_end = scanner.string_end(pos)
+            pos = string_end
+            depth = len(containers)
+            if not (0 < depth <= len(path) and containers == [_OPEN_OBJECT] * depth):
+                continue
+            colon = _WHITESPACE.match(buf, string_end).end()
+            if buf[colon:colon + 1] != b":":
+                continue
+            key = json.loads(buf[at:string_end])
+            value_start = _WHITESPACE.match(buf, colon + 1).end()
+            if key != path[depth - 1]:
+                # Skip the values off the path, like the cycling data, as a whole.
+                pos = _value_end(scanner, value_start)
+            elif depth == len(path):
+                return value_start, _value_end(scanner, value_start)
+        elif char in _OPENING:
+            containers.append(char)
+        else:
+            containers.pop()
+    msg = f"No {'/'.join(path)} section in the file"
+    raise KeyError(msg)
+
+
+def _value_end(scanner: _StructureScanner, start: int) -> int:
+    """Get the end offset of the JSON value starting at `start`."""
+    buf = scanner.buf
+    first = buf[start]
+    if first == _QUOTE:
+        return scanner.string_end(start + 1)
+    if first not in _OPENING:
+        return _SCALAR_END.match(buf, start).end()
+    depth = 0
+    pos = start
+    while (at := scanner.search(pos)) is not None:
+        char = buf[at]
+        pos = at + 1
+        if char == _QUOTE:
+            pos = scanner.string_end(pos)
+        elif char in _OPENING:
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return pos
+    msg = "Unterminated value in the JSON file"
+    raise ValueError(msg)
@@ -0,0 +1,241 @@
+"""Regenerate the JSON-LD files of many merged metadata Excel files in parallel.
+
+Every `*_merged_metadata.xlsx` file found in the given directories, or listed explicitly, is converted to
+`ontologized_<exp>.json` next to it, on a pool of worker processes sized to the machine. Each worker parses the
+template once and converts its files one after the other. Outputs are written atomically, and a state file records
+the inputs each output was made from, so that running the conversion again only converts the files whose Excel file,
+template or output options changed.
+
+Usage:
+    python -m obvibe.batch_jsonld /data/experiments --template Battinfo_template.xlsx --workers 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import oh_my_ontology
+from .manifest import file_fingerprint
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+STATE_NAME = ".obvibe_jsonld_state.json"
+MERGED_SUFFIX = "_merged_metadata.xlsx"
+
+
+@dataclass
+class BatchSummary:
+    """Counts and throughput of a batch conversion."""
+
+    converted: int = 0
+    skipped: int = 0
+    failed: dict[str, str] = field(default_factory=dict)
+    bytes_in: int = 0
+    bytes_out: int = 0
+    duration: float = 0.0
+
+    def format(self) -> str:
+        """Describe the counts and throughput in one line."""
+        rate = self.converted / self.duration if self.duration else 0.0
+        return (
+            f"{self.converted} converted, {self.skipped} unchanged, {len(self.failed)} failed in {self.duration:.1f} s "
+            f"({rate:.1f} files/s, {self.bytes_in / 1024**2:.1f} MB read, {self.bytes_out / 1024**2:.1f} MB written)"
+        )
+
+
+def find_merged_metadata(paths: Iterable[str | Path]) -> list[Path]:
+    """Get the merged metadata Excel files in the given directory trees, plus the given files themselves."""
+    found = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            found += sorted(path.rglob(f"*{MERGED_SUFFIX}"))
+        else:
+            found.append(path)
+    return list(dict.fromkeys(file.resolve() for file in found))
+
+
+def default_state_file(paths: Iterable[str | Path]) -> Path:
+    """Get the default state file for the given directories and files, in the deepest directory containing them all.
+
+    The state thus stays with the searched tree, whatever the working directory of the conversion is. If the paths
+    have no common directory, e.g. on different drives, the state file is put in the working directory.
+    """
+    dirs = [path if path.is_dir() else path.parent for path in (Path(p).resolve() for p in paths)]
+    try:
+        return Path(os.path.commonpath(dirs)) / STATE_NAME
+    except ValueError:
+        return Path(STATE_NAME)
+
+
+def jsonld_path(dir_xlsx: Path, compression: str | None = None) -> Path:
+    """Get the path of the JSON-LD file generated from a merged metadata Excel file."""
+    exp_name = dir_xlsx.name.removesuffix(MERGED_SUFFIX)
+    name = f"ontologized_{exp_name}.json"
+    if compression is not None:
+        name += oh_my_ontology.JSONLD_COMPRESSION_SUFFIXES[compression]
+    return dir_xlsx.with_name(name)
+
+
+def _convert(
+        dir_xlsx: Path, dir_template: str | None, indent: int | None, compression: str | None,
+) -> tuple[int, int]:
+    """Convert one file in a worker process and return the bytes read and written."""
+    output = oh_my_ontology.gen_jsonld(
+        dir_xlsx, jsonld_path(dir_xlsx).name, dir_template=dir_template, indent=indent, compression=compression,
+    )
+    return dir_xlsx.stat().st_size, output.stat().st_size
+
+
+class _State:
+    """The inputs each output was made from, kept in a JSON file."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if path.exists():
+            with path.open() as f:
+                self.entries = json.load(f)
+
+    def inputs(self, output: Path, files: list[Path], options: dict) -> dict:
+        """Fingerprint the input files, reusing the recorded hashes of the files that look unchanged."""
+        previous = self.entries.get(str(output), {}).get("inputs", {})
+        files = {str(file): file_fingerprint(file, previous.get("files", {}).get(str(file))) for file in files}
+        return {"files": files, "options": options}
+
+    def is_current(self, output: Path, inputs: dict) -> bool:
+        recorded = self.entries.get(str(output), {}).get("inputs")
+        if recorded is None or not output.exists():
+            return False
+        files = {name: fingerprint["sha256"] for name, fingerprint in inputs["files"].items()}
+        recorded_files = {name: fingerprint["sha256"] for name, fingerprint in recorded["files"].items()}
+        return files == recorded_files and recorded["options"] == inputs["options"]
+
+    def save(self) -> None:
+        """Write the state file atomically."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self.entries, f, indent=1)
+        tmp_path.replace(self.path)
+
+
+def convert_all(
+        files: list[Path],
+        dir_template: str | None = None,
+        indent: int | None = 4,
+        compression: str | None = None,
+        max_workers: int | None = None,
+        state_file: str | Path | None = None,
+        force: bool = False,
+) -> BatchSummary:
+    """Convert merged metadata Excel files to JSON-LD on a process pool, skipping the unchanged ones.
+
+    Args:
+        files (list[Path]): The merged metadata Excel files.
+        dir_template (str, optional): The template the files were made from. If given, only the Schema sheet of each
+            file is read, the other sheets come from the template, and a change of the template converts every file
+            again. Defaults to None, reading all sheets from each file.
+        indent (int | None, optional): The indentation of the JSON-LD files, None for compact JSON. Defaults to 4.
+        compression (str | None, optional): Compress the JSON-LD files with "gzip" or "zstd". Defaults to None.
+        max_workers (int, optional): The number of worker processes. Defaults to the default of
+            `ProcessPoolExecutor`, the number of CPUs within the limits of the platform.
+        state_file (str | Path, optional): The file recording the inputs of each output. Defaults to
+            `.obvibe_jsonld_state.json` in the deepest directory containing all files, see `default_state_file`.
+        force (bool, optional): Convert all files, even if their inputs did not change. Defaults to False.
+
+    Returns:
+        BatchSummary: The number of converted, skipped and failed files and the throughput.
+
+    """
+    start = time.perf_counter()
+    summary = BatchSummary()
+    state = _State(Path(state_file) if state_file is not None else default_state_file(files))
+    options = {"template": dir_template, "indent": indent, "compression": compression}
+
+    pending = {}
+    for dir_xlsx in files:
+        output = jsonld_path(dir_xlsx, compression)
+        try:
+            inputs = state.inputs(output, [dir_xlsx] + ([Path(dir_template)] if dir_template else []), options)
+        except OSError as e:
+            summary.failed[str(dir_xlsx)] = f"{type(e).__name__}: {e}"
+            continue
+        if not force and state.is_current(output, inputs):
+            summary.skipped += 1
+            continue
+        pending[dir_xlsx] = (output, inputs)
+
+    try:
+        if pending:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {
+                    pool.submit(_convert, dir_xlsx, dir_template, indent, compression): dir_xlsx
+                    for dir_xlsx in pending
+                }
+                for future in as_completed(futures):
+                    dir_xlsx = futures[future]
+                    try:
+                        bytes_in, bytes_out = future.result()
+                    except Exception as e:
+                        summary.failed[str(dir_xlsx)] = f"{type(e).__name__}: {e}"
+                        continue
+                    output, inputs = pending[dir_xlsx]
+                    state.entries[str(output)] = {"inputs": inputs}
+                    summary.converted += 1
+                    summary.bytes_in += bytes_in
+                    summary.bytes_out += bytes_out
+    finally:
+        # Keep the progress of an interrupted run.
+        state.save()
+        summary.duration = time.perf_counter() - start
+    return summary
+
+
+def main() -> int:
+    """Run the batch conversion from the command line and return the exit code."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="Directories to search and merged metadata Excel files")
+    parser.add_argument("--files-from", help="A file listing one merged metadata Excel file per line")
+    parser.add_argument("--template", help="The template the files were made from")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, defaults to the CPU count")
+    parser.add_argument("--compact", action="store_true", help="Write compact JSON without indentation")
+    parser.add_argument("--compression", choices=sorted(oh_my_ontology.JSONLD_COMPRESSION_SUFFIXES))
+    parser.add_argument(
+        "--state", help=f"File recording the inputs of each output, defaults to {STATE_NAME} in the searched tree",
+    )
+    parser.add_argument("--force", action="store_true", help="Convert all files, even unchanged ones")
+    args = parser.parse_args()
+
+    paths = list(args.paths)
+    if args.files_from:
+        with Path(args.files_from).open() as f:
+            paths += [line.strip() for line in f if line.strip()]
+    if not paths:
+        parser.error("no directories or files given")
+
+    files = find_merged_metadata(paths)
+    summary = convert_all(
+        files,
+        dir_template=args.template,
+        indent=None if args.compact else 4,
+        compression=args.compression,
+        max_workers=args.workers,
+        state_file=args.state if args.state is not None else default_state_file(paths),
+        force=args.force,
+    )
+    for file, error in summary.failed.items():
+        print(f"FAILED {file}: {error}")
+    print(summary.format())
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
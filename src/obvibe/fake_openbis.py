@@ -0,0 +1,332 @@
+"""Local stand-in for `pybis.Openbis`, to measure pushes without a live openBIS server.
+
+`FakeOpenbis` implements the part of the pybis API that `vibing.push_exp`, `vibing.update_exp`, `vibing.push_many`
+and the chunked upload in `streaming` use, including the V3 API requests sent directly by `keller`. Every call that
+would be a round trip to the server is recorded together with the bytes it sends, and can be delayed by a
+configurable latency and bandwidth, so that the number of round trips and the time spent on the network can be
+compared between versions.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+@dataclass
+class FakeCall:
+    """A round trip to the fake openBIS server."""
+
+    method: str
+    bytes_sent: int
+    duration: float
+
+
+@dataclass
+class CallStats:
+    """Totals of the round trips recorded by a `FakeOpenbis`."""
+
+    round_trips: int = 0
+    bytes_sent: int = 0
+    network_time: float = 0.0
+    by_method: dict[str, int] = field(default_factory=dict)
+
+
+class FakeExperiment:
+    """An openBIS experiment of a `FakeOpenbis`, with its properties in `p`."""
+
+    def __init__(self, ob: FakeOpenbis, code: str, experiment_type: str, project: str) -> None:
+        self.openbis = ob
+        self.code = code.upper()
+        self.type = experiment_type
+        self.identifier = f"{project}/{code}".upper()
+        self.p = {}
+        self.saved = False
+
+    def save(self) -> None:
+        """Store the experiment and its properties in the session.
+
+        Raises:
+            ValueError: If the experiment is new and one with the same identifier exists already, as in openBIS.
+
+        """
+        self.openbis.round_trip("experiment.save", len(json.dumps(self.p, default=str)))
+        if not self.saved and self.identifier in self.openbis.experiments:
+            msg = f"Experiment {self.identifier} already exists"
+            raise ValueError(msg)
+        self.saved = True
+        self.openbis.experiments[self.identifier] = self
+
+
+class FakeDataSet:
+    """An openBIS dataset of a `FakeOpenbis`. Saving it sends the whole file."""
+
+    def __init__(self, ob: FakeOpenbis, dataset_type: str, experiment: str, file: str | Path | None) -> None:
+        self.openbis = ob
+        self.type = dataset_type.upper()
+        self.experiment = experiment.upper()
+        self.file = file
+        self.permId = None
+
+    def save(self) -> FakeDataSet:
+        """Upload the file and register the dataset, setting its permId."""
+        # pybis uploads the file to the session workspace and then registers the dataset.
+        self.openbis.round_trip("dataset.upload", Path(self.file).stat().st_size)
+        self.openbis.round_trip("dataset.register", 0)
+        self.permId = self.openbis.register_dataset(self)
+        return self
+
+
+class _FakeResponse:
+    def raise_for_status(self) -> None:
+        pass
+
+
+class _FakeHttp:
+    """Connection pool of a `FakeOpenbis`, receiving the chunks of `streaming.upload_file_chunked`."""
+
+    def __init__(self, ob: FakeOpenbis) -> None:
+        self.openbis = ob
+
+    def post(self, url: str, params: dict | None = None, data: bytes = b"", **kwargs: dict) -> _FakeResponse:
+        self.openbis.round_trip("session_workspace_file_upload", len(data))
+        return _FakeResponse()
+
+
+class _FakeThings:
+    """Search result of a `FakeOpenbis`, exposing the `df` attribute of pybis search results."""
+
+    def __init__(self, df: pd.DataFrame) -> None:
+        self.df = df
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+
+class FakeOpenbis:
+    """In-process stand-in for an authenticated `pybis.Openbis` session.
+
+    Experiments and datasets are kept in memory. Calls that are local in pybis, like `new_experiment` and
+    `new_dataset`, are free, while saves, searches and uploads are recorded as round trips.
+
+    Args:
+        latency (float, optional): Seconds added to every round trip. Defaults to 0.
+        bandwidth (float, optional): Upload bandwidth in bytes per second, per connection. Defaults to None,
+            meaning unlimited.
+        url (str, optional): The URL the session pretends to be connected to.
+
+    """
+
+    as_v3 = "/openbis/openbis/rmi-application-server-v3.json"
+    dss_v3 = "/datastore_server/rmi-data-store-server-v3.json"
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            bandwidth: float | None = None,
+            url: str = "https://openbis.fake",
+    ) -> None:
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.url = url
+        self.token = "fake-token"
+        self.verify_certificates = False
+        self.experiments: dict[str, FakeExperiment] = {}
+        self.datasets: dict[str, FakeDataSet] = {}
+        # Property types by code and the property codes assigned to each experiment type.
+        self.property_types: dict[str, dict] = {}
+        self.experiment_types: dict[str, list[str]] = {}
+        self.calls: list[FakeCall] = []
+        self._http = _FakeHttp(self)
+        self._lock = threading.Lock()
+        self._perm_ids = itertools.count(1)
+
+    def round_trip(self, method: str, bytes_sent: int = 0) -> None:
+        """Record a round trip and wait as long as the configured network would take."""
+        duration = self.latency
+        if self.bandwidth:
+            duration += bytes_sent / self.bandwidth
+        if duration > 0:
+            time.sleep(duration)
+        with self._lock:
+            self.calls.append(FakeCall(method, bytes_sent, duration))
+
+    def stats(self) -> CallStats:
+        """Get the totals of the round trips recorded so far."""
+        stats = CallStats()
+        with self._lock:
+            calls = list(self.calls)
+        for call in calls:
+            stats.round_trips += 1
+            stats.bytes_sent += call.bytes_sent
+            stats.network_time += call.duration
+            stats.by_method[call.method] = stats.by_method.get(call.method, 0) + 1
+        return stats
+
+    def reset_calls(self) -> None:
+        """Forget the recorded round trips, keeping the experiments and datasets."""
+        with self._lock:
+            self.calls.clear()
+
+    def register_dataset(self, dataset: FakeDataSet) -> str:
+        """Store a dataset under a new permId and return it."""
+        with self._lock:
+            perm_id = f"20240101000000000-{next(self._perm_ids)}"
+            self.datasets[perm_id] = dataset
+        return perm_id
+
+    def is_session_active(self) -> bool:
+        """Check the session, which never expires."""
+        self.round_trip("isSessionActive")
+        return True
+
+    def new_experiment(self, code: str, type: str, project: str) -> FakeExperiment:
+        """Create an experiment, stored when it is saved."""
+        return FakeExperiment(self, code, type, project)
+
+    def get_experiment(self, identifier: str) -> FakeExperiment:
+        """Get a saved experiment by identifier."""
+        self.round_trip("get_experiment")
+        try:
+            return self.experiments[identifier.upper()]
+        except KeyError:
+            msg = f"No such experiment: {identifier}"
+            raise ValueError(msg) from None
+
+    def new_dataset(self, type: str, experiment: str, file: str | Path) -> FakeDataSet:
+        """Create a dataset, uploaded when it is saved."""
+        return FakeDataSet(self, type, experiment, file)
+
+    def get_datasets(
+            self,
+            type: str | None = None,
+            experiment: str | list[str] | None = None,
+            **kwargs: dict,
+    ) -> _FakeThings:
+        """Search the datasets by type and experiments."""
+        import pandas as pd
+
+        self.round_trip("get_datasets")
+        if isinstance(experiment, str):
+            experiment = [experiment]
+        experiments = {e.upper() for e in experiment} if experiment is not None else None
+        with self._lock:
+            rows = [
+                {"permId": perm_id, "type": dataset.type, "experiment": dataset.experiment}
+                for perm_id, dataset in self.datasets.items()
+                if (type is None or dataset.type == type.upper())
+                and (experiments is None or dataset.experiment in experiments)
+            ]
+        return _FakeThings(pd.DataFrame(rows, columns=["permId", "type", "experiment"]))
+
+    def get_datastores(self) -> pd.DataFrame:
+        """List the single data store, served at the session URL."""
+        import pandas as pd
+
+        self.round_trip("get_datastores")
+        return pd.DataFrame({"code": ["DSS1"], "downloadUrl": [self.url]})
+
+    def _post_request(self, resource: str, request: dict) -> dict:
+        return self._post_request_full_url(urljoin(self.url, resource), request)
+
+    def _post_request_full_url(self, full_url: str, request: dict) -> dict:
+        self.round_trip(request["method"], len(json.dumps(request, default=str)))
+        method, params = request["method"], request["params"]
+        if method == "createUploadedDataSet":
+            creation = params[1]
+            dataset = FakeDataSet(
+                self, creation["typeId"]["permId"], creation["experimentId"]["identifier"], None,
+            )
+            return {"permId": self.register_dataset(dataset)}
+        if method == "getExperiments":
+            return {
+                experiment_id["identifier"]: self._experiment_data(experiment_id["identifier"].upper())
+                for experiment_id in params[1]
+                if experiment_id["identifier"].upper() in self.experiments
+            }
+        if method == "updateExperiments":
+            for update in params[1]:
+                experiment = self.experiments[update["experimentId"]["identifier"].upper()]
+                for code, value in update.get("properties", {}).items():
+                    experiment.p[code.lower()] = value
+            return {}
+        if method == "deleteDataSets":
+            with self._lock:
+                for dataset_id in params[1]:
+                    self.datasets.pop(dataset_id["permId"], None)
+        if method in {"getPropertyTypes", "getExperimentTypes", "createPropertyTypes", "updatePropertyTypes",
+                      "createExperimentTypes", "updateExperimentTypes"}:
+            return self._schema_request(method, params)
+        return {}
+
+    def _schema_request(self, method: str, params: list) -> dict:
+        """Answer the V3 API requests on property and experiment types."""
+        if method == "getPropertyTypes":
+            return {
+                type_id["permId"]: {"code": type_id["permId"], **self.property_types[type_id["permId"]]}
+                for type_id in params[1]
+                if type_id["permId"] in self.property_types
+            }
+        if method == "getExperimentTypes":
+            return {
+                type_id["permId"]: {
+                    "code": type_id["permId"],
+                    "propertyAssignments": [
+                        {"propertyType": {"code": code}} for code in self.experiment_types[type_id["permId"]]
+                    ],
+                }
+                for type_id in params[1]
+                if type_id["permId"] in self.experiment_types
+            }
+        if method == "createPropertyTypes":
+            for creation in params[1]:
+                if creation["code"] in self.property_types:
+                    msg = f"Property type {creation['code']} already exists"
+                    raise ValueError(msg)
+                self.property_types[creation["code"]] = {
+                    attr: creation[attr] for attr in ("label", "description", "dataType")
+                }
+        elif method == "updatePropertyTypes":
+            for update in params[1]:
+                property_type = self.property_types[update["typeId"]["permId"]]
+                for attr in ("label", "description"):
+                    if attr in update:
+                        property_type[attr] = update[attr]["value"]
+        elif method == "createExperimentTypes":
+            for creation in params[1]:
+                self.experiment_types[creation["code"]] = [
+                    assignment["propertyTypeId"]["permId"] for assignment in creation["propertyAssignments"]
+                ]
+        else:
+            for update in params[1]:
+                assigned = self.experiment_types[update["typeId"]["permId"]]
+                for action in update["propertyAssignments"]["actions"]:
+                    assigned += [assignment["propertyTypeId"]["permId"] for assignment in action["items"]]
+        return {}
+
+    def _experiment_data(self, identifier: str) -> dict:
+        """Serialize an experiment like the openBIS V3 API, with its property values as strings."""
+        experiment = self.experiments[identifier]
+        with self._lock:
+            datasets = [
+                {"permId": {"permId": perm_id}, "type": {"code": dataset.type}}
+                for perm_id, dataset in self.datasets.items()
+                if dataset.experiment == identifier
+            ]
+        return {
+            "identifier": {"identifier": identifier},
+            "properties": {code.upper(): str(value) for code, value in experiment.p.items() if value is not None},
+            "dataSets": datasets,
+        }
+
+    def logout(self) -> None:
+        """End the session, which does nothing here."""
@@ -0,0 +1,201 @@
+"""Per-stage timing and openBIS round-trip counting for pushes.
+
+`vibing.push_exp` collects a `PushMetrics` for every experiment. The code of a push marks its stages with `stage`, and
+the openBIS calls and uploaded bytes are attributed to the innermost active stage with `record`. Outside of a
+collection both are no-ops, so the functions of `oh_my_ontology` can be instrumented unconditionally.
+
+The metrics can be exported as JSON lines or in the Prometheus text format, e.g. for the textfile collector of the
+node exporter.
+"""
+
+import json
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of one stage of a push. A stage that ran several times accumulates."""
+
+    duration: float = 0.0
+    runs: int = 0
+    openbis_calls: int = 0
+    bytes_uploaded: int = 0
+    errors: int = 0
+
+
+@dataclass
+class PushMetrics:
+    """Measurements of the push of one experiment.
+
+    Stages nested in other stages are named by their path, e.g. "metadata/jsonld", so the durations of the top-level
+    stages do not overlap. Stages that run concurrently, like the uploads of a pipelined push, can add up to more than
+    `duration`.
+    """
+
+    experiment_identifier: str | None = None
+    duration: float = 0.0
+    stages: dict[str, StageMetrics] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def openbis_calls(self) -> int:
+        """The openBIS calls of all stages."""
+        return sum(s.openbis_calls for s in self.stage_items().values())
+
+    @property
+    def bytes_uploaded(self) -> int:
+        """The bytes uploaded by all stages."""
+        return sum(s.bytes_uploaded for s in self.stage_items().values())
+
+    @property
+    def errors(self) -> int:
+        """The errors of all stages."""
+        return sum(s.errors for s in self.stage_items().values())
+
+    def stage_items(self) -> dict[str, StageMetrics]:
+        """Get a copy of the stages, safe to iterate while other threads add to them."""
+        with self._lock:
+            return dict(self.stages)
+
+    def add(
+            self,
+            stage_name: str,
+            duration: float = 0.0,
+            runs: int = 0,
+            openbis_calls: int = 0,
+            bytes_uploaded: int = 0,
+            errors: int = 0,
+    ) -> None:
+        """Add measurements to a stage, creating it if needed."""
+        with self._lock:
+            stage_metrics = self.stages.setdefault(stage_name, StageMetrics())
+            stage_metrics.duration += duration
+            stage_metrics.runs += runs
+            stage_metrics.openbis_calls += openbis_calls
+            stage_metrics.bytes_uploaded += bytes_uploaded
+            stage_metrics.errors += errors
+
+    def to_dict(self) -> dict:
+        """Get the measurements as a JSON-serialisable dictionary."""
+        stages = {name: asdict(s) for name, s in self.stage_items().items()}
+        return {
+            "experiment_identifier": self.experiment_identifier,
+            "duration": self.duration,
+            "openbis_calls": self.openbis_calls,
+            "bytes_uploaded": self.bytes_uploaded,
+            "errors": self.errors,
+            "stages": stages,
+        }
+
+    def to_json_line(self) -> str:
+        """Get the measurements as one line of JSON."""
+        return json.dumps(self.to_dict())
+
+
+# The metrics being collected and the path of the innermost active stage.
+_current: ContextVar[tuple[PushMetrics, str] | None] = ContextVar("obvibe_push_metrics", default=None)
+
+
+@contextmanager
+def collect(metrics: PushMetrics) -> Iterator[PushMetrics]:
+    """Collect the stages run in this context, and in threads started with a copy of it, into `metrics`.
+
+    The total duration of the context is added to `metrics.duration`.
+    """
+    token = _current.set((metrics, ""))
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        metrics.duration += time.perf_counter() - start
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a stage of the current push. An exception leaving the stage is counted as an error and re-raised."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    metrics, parent = current
+    stage_name = f"{parent}/{name}" if parent else name
+    token = _current.set((metrics, stage_name))
+    start = time.perf_counter()
+    errors = 0
+    try:
+        yield
+    except BaseException:
+        errors = 1
+        raise
+    finally:
+        _current.reset(token)
+        metrics.add(stage_name, duration=time.perf_counter() - start, runs=1, errors=errors)
+
+
+def record(openbis_calls: int = 0, bytes_uploaded: int = 0, errors: int = 0) -> None:
+    """Attribute openBIS calls, uploaded bytes or handled errors to the innermost active stage."""
+    current = _current.get()
+    if current is None:
+        return
+    metrics, stage_name = current
+    metrics.add(stage_name or "other", openbis_calls=openbis_calls, bytes_uploaded=bytes_uploaded, errors=errors)
+
+
+def write_json_lines(metrics: Iterable[PushMetrics], path: str | Path) -> None:
+    """Append the metrics of several pushes to a JSON lines file, one experiment per line."""
+    with Path(path).open("a") as f:
+        f.writelines(m.to_json_line() + "\n" for m in metrics)
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(metrics: Iterable[PushMetrics]) -> str:
+    """Format the metrics of several pushes in the Prometheus text exposition format.
+
+    Args:
+        metrics (Iterable[PushMetrics]): The metrics of the pushes, labelled by their experiment identifier.
+
+    Returns:
+        str: The metric families obvibe_push_duration_seconds, obvibe_stage_duration_seconds,
+            obvibe_stage_openbis_calls, obvibe_stage_bytes_uploaded and obvibe_stage_errors.
+
+    """
+    metrics = list(metrics)
+    stage_families = [
+        ("obvibe_stage_duration_seconds", "Time spent in a push stage.", "duration"),
+        ("obvibe_stage_openbis_calls", "Round trips to openBIS made in a push stage.", "openbis_calls"),
+        ("obvibe_stage_bytes_uploaded", "Bytes uploaded to openBIS in a push stage.", "bytes_uploaded"),
+        ("obvibe_stage_errors", "Errors raised or recorded in a push stage.", "errors"),
+    ]
+    lines = [
+        "# HELP obvibe_push_duration_seconds Wall time of the push of an experiment.",
+        "# TYPE obvibe_push_duration_seconds gauge",
+    ]
+    lines += [
+        f'obvibe_push_duration_seconds{{experiment="{_label(m.experiment_identifier)}"}} {m.duration}'
+        for m in metrics
+    ]
+    for name, description, attribute in stage_families:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+        for m in metrics:
+            for stage_name, stage_metrics in m.stage_items().items():
+                labels = f'experiment="{_label(m.experiment_identifier)}",stage="{_label(stage_name)}"'
+                lines.append(f"{name}{{{labels}}} {getattr(stage_metrics, attribute)}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(metrics: Iterable[PushMetrics], path: str | Path) -> None:
+    """Write the metrics of several pushes to a Prometheus textfile, atomically replacing an earlier one."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(to_prometheus(metrics))
+    tmp_path.replace(path)
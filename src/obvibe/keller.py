@@ -2,9 +2,32 @@
 
 import os
 import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 from functools import wraps
+from pathlib import Path
 
 import pybis
+from pybis.utils import parse_jackson
+
+from . import pathfolio
+
+# Process-wide cache of authenticated openBIS sessions, keyed by (url, PAT file path). `_SESSION_LOCK` only guards
+# the dictionaries, a session is checked and rebuilt while holding the lock of its key.
+_SESSION_CACHE: dict[tuple[str, str], "_CachedSession"] = {}
+_SESSION_KEY_LOCKS: dict[tuple[str, str], threading.Lock] = {}
+_SESSION_LOCK = threading.Lock()
+
+# Resolved dataset permIds, keyed by (experiment identifier, dataset type). PermIds never change once assigned, but an
+# entry is dropped when `delete_datasets` replaces the dataset.
+_PERMID_CACHE: dict[tuple[str, str], str] = {}
+_PERMID_LOCK = threading.Lock()
 
 
 def make_new_property(
@@ -17,6 +40,8 @@ def make_new_property(
 ) -> None:
     """Create a new property type in openBIS and assign it to a specified collection type.
 
+    To bring a whole collection type in line with `pathfolio.premise3_collection`, use `sync_schema` instead.
+
     Args:
         openbis_object (Openbis): An authenticated instance of the openBIS API.
         new_property_code (str): The unique code for the new property type.
@@ -51,25 +76,251 @@ def make_new_property(
     # Assign the newly created property to the collection type
     collection_type.assign_property(new_property_code)
 
+
+@dataclass
+class SchemaSyncReport:
+    """The changes `sync_schema` made, or would make in a dry run, to bring openBIS in line with a collection."""
+
+    collection_type: str
+    dry_run: bool
+    create_collection_type: bool = False
+    created: list[str] = field(default_factory=list)
+    updated: dict[str, dict[str, tuple[str | None, str]]] = field(default_factory=dict)
+    assigned: list[str] = field(default_factory=list)
+    conflicts: dict[str, str] = field(default_factory=dict)
+    n_calls: int = 0
+
+    @property
+    def in_sync(self) -> bool:
+        """Whether openBIS already matched the collection, apart from conflicts."""
+        return not (self.create_collection_type or self.created or self.updated or self.assigned)
+
+    def summary(self) -> str:
+        """Describe the changes, one line per property type."""
+        verb = "Would sync" if self.dry_run else "Synced"
+        lines = [f"{verb} collection type {self.collection_type} ({self.n_calls} openBIS calls)"]
+        if self.create_collection_type:
+            lines.append(f"  create collection type {self.collection_type}")
+        lines += [f"  create property type {code}" for code in self.created]
+        for code, changes in self.updated.items():
+            details = ", ".join(f"{attr}: {old!r} -> {new!r}" for attr, (old, new) in changes.items())
+            lines.append(f"  update property type {code} ({details})")
+        lines += [f"  assign {code} to {self.collection_type}" for code in self.assigned]
+        lines += [f"  conflict {code}: {message}" for code, message in self.conflicts.items()]
+        if self.in_sync and not self.conflicts:
+            lines.append("  nothing to do")
+        return "\n".join(lines)
+
+
+def _property_type_id(code: str) -> dict:
+    return {"@type": "as.dto.property.id.PropertyTypePermId", "permId": code.upper()}
+
+
+def _experiment_type_id(code: str) -> dict:
+    return {"@type": "as.dto.entitytype.id.EntityTypePermId", "permId": code.upper(), "entityKind": "EXPERIMENT"}
+
+
+def _field_update(value: str) -> dict:
+    return {"@type": "as.dto.common.update.FieldUpdateValue", "isModified": True, "value": value}
+
+
+def sync_schema(
+    openbis_object: pybis.Openbis,
+    collection: list[dict] = pathfolio.premise3_collection,
+    collection_type_code: str = "battery_premise3",
+    dry_run: bool = False,
+) -> SchemaSyncReport:
+    """Create, update and assign the property types of a collection type in bulk.
+
+    The existing property types and the assignments of the collection type are fetched with one call each. Then the
+    missing property types are created in one call, the ones whose label or description changed are updated in one
+    call, and the missing assignments are added in one call. A missing collection type is created together with all
+    its assignments. Unlike `make_new_property` in a loop, existing entries are left alone instead of failing.
+
+    Args:
+        openbis_object (Openbis): An authenticated instance of the openBIS API.
+        collection (list[dict], optional): The property types, as dictionaries with the keys "metadata" (used as
+            label), "openbis_code", "description" and "type". Defaults to `pathfolio.premise3_collection`.
+        collection_type_code (str, optional): The code of the collection type the property types are assigned to.
+            Defaults to 'battery_premise3'.
+        dry_run (bool, optional): Only fetch the current schema and report what would change. Defaults to False.
+
+    Returns:
+        SchemaSyncReport: The created, updated and assigned property types, the property types whose data type
+            differs from openBIS, which cannot be changed and are left as they are, and the number of calls made.
+
+    """
+    report = SchemaSyncReport(collection_type=collection_type_code.upper(), dry_run=dry_run)
+    wanted = {entry["openbis_code"].upper(): entry for entry in collection}
+
+    def post(request: dict) -> dict:
+        report.n_calls += 1
+        resp = openbis_object._post_request(openbis_object.as_v3, request)
+        if isinstance(resp, dict):
+            parse_jackson(resp)
+        return resp
+
+    existing = post({
+        "method": "getPropertyTypes",
+        "params": [
+            openbis_object.token,
+            [_property_type_id(code) for code in wanted],
+            {"@type": "as.dto.property.fetchoptions.PropertyTypeFetchOptions"},
+        ],
+    })
+    collection_types = post({
+        "method": "getExperimentTypes",
+        "params": [
+            openbis_object.token,
+            [_experiment_type_id(collection_type_code)],
+            {
+                "@type": "as.dto.experiment.fetchoptions.ExperimentTypeFetchOptions",
+                "propertyAssignments": {
+                    "@type": "as.dto.property.fetchoptions.PropertyAssignmentFetchOptions",
+                    "propertyType": {"@type": "as.dto.property.fetchoptions.PropertyTypeFetchOptions"},
+                },
+            },
+        ],
+    })
+    existing = {code.upper(): data for code, data in (existing or {}).items()}
+    collection_type = next(iter(collection_types.values()), None) if collection_types else None
+    assigned = {
+        assignment["propertyType"]["code"].upper()
+        for assignment in (collection_type or {}).get("propertyAssignments") or []
+    }
+    report.create_collection_type = collection_type is None
+
+    # Compare the wanted property types with openBIS.
+    creations, updates = [], []
+    for code, entry in wanted.items():
+        label, description, data_type = entry["metadata"], entry["description"], entry["type"].upper()
+        current = existing.get(code)
+        if current is None:
+            report.created.append(code)
+            creations.append({
+                "@type": "as.dto.property.create.PropertyTypeCreation",
+                "code": code,
+                "label": label,
+                "description": description,
+                "dataType": data_type,
+            })
+        else:
+            if current.get("dataType") != data_type:
+                report.conflicts[code] = f"data type is {current.get('dataType')}, expected {data_type}"
+            changes = {
+                attr: (current.get(attr), value)
+                for attr, value in (("label", label), ("description", description))
+                if current.get(attr) != value
+            }
+            if changes:
+                report.updated[code] = changes
+                updates.append({
+                    "@type": "as.dto.property.update.PropertyTypeUpdate",
+                    "typeId": _property_type_id(code),
+                    **{attr: _field_update(new) for attr, (_, new) in changes.items()},
+                })
+        if code not in assigned:
+            report.assigned.append(code)
+    assignments = [
+        {
+            "@type": "as.dto.property.create.PropertyAssignmentCreation",
+            "propertyTypeId": _property_type_id(code),
+            "mandatory": False,
+            "showInEditView": True,
+            "showRawValueInForms": True,
+        }
+        for code in report.assigned
+    ]
+    if dry_run:
+        return report
+
+    if creations:
+        post({"method": "createPropertyTypes", "params": [openbis_object.token, creations]})
+    if updates:
+        post({"method": "updatePropertyTypes", "params": [openbis_object.token, updates]})
+    if report.create_collection_type:
+        creation = {
+            "@type": "as.dto.experiment.create.ExperimentTypeCreation",
+            "code": collection_type_code.upper(),
+            "propertyAssignments": assignments,
+        }
+        post({"method": "createExperimentTypes", "params": [openbis_object.token, [creation]]})
+    elif assignments:
+        update = {
+            "@type": "as.dto.experiment.update.ExperimentTypeUpdate",
+            "typeId": _experiment_type_id(collection_type_code),
+            "propertyAssignments": {
+                "@type": "as.dto.entitytype.update.PropertyAssignmentListUpdateValue",
+                "actions": [{"@type": "as.dto.common.update.ListUpdateActionAdd", "items": assignments}],
+                "forceRemovingAssignments": False,
+            },
+        }
+        post({"method": "updateExperimentTypes", "params": [openbis_object.token, [update]]})
+    return report
+
+@dataclass
+class _CachedSession:
+    ob: pybis.Openbis
+    pat_mtime: int
+    validated_at: float
+
+
 def get_openbis_obj(dir_pat: str,
                      url: str = r"https://openbis-empa-lab501.ethz.ch/",
+                     use_cache: bool = True,
+                     revalidate_after: float = 300.0,
                      ) -> pybis.Openbis:
     """Get the openbis object from PAT.
 
+    By default the session is cached per process, keyed by URL and PAT file, and handed out to every caller, so
+    repeated pushes do not redo the connection setup and token validation. A cached session is checked again once
+    it is older than `revalidate_after` seconds and is rebuilt if it expired or if the PAT file changed.
+
     Args:
         dir_pat (str): The directory of the PAT file.
         url (str, optional): The URL of the openBIS server.
             Defaults to r"https://openbis-empa-lab501.ethz.ch/".
+        use_cache (bool, optional): Reuse the cached session for this URL and PAT file. Defaults to True.
+        revalidate_after (float, optional): Seconds after which a cached session is checked with the server
+            before being reused. Defaults to 300.
 
     Returns:
         pybis.Openbis: The openbis object.
 
     """
-    with open(dir_pat) as f:
-        token = f.read().strip()
-    ob = pybis.Openbis(url)
-    ob.set_token(token)
-    return ob
+    if not use_cache:
+        token = Path(dir_pat).read_text().strip()
+        ob = pybis.Openbis(url)
+        ob.set_token(token)
+        return ob
+
+    key = (url, str(Path(dir_pat).resolve()))
+    pat_mtime = Path(dir_pat).stat().st_mtime_ns
+    with _SESSION_LOCK:
+        key_lock = _SESSION_KEY_LOCKS.setdefault(key, threading.Lock())
+    # Concurrent callers for the same key wait for one check or rebuild, callers for other keys are not blocked.
+    with key_lock:
+        with _SESSION_LOCK:
+            cached = _SESSION_CACHE.get(key)
+        if cached is not None and cached.pat_mtime == pat_mtime:
+            now = time.monotonic()
+            if now - cached.validated_at < revalidate_after:
+                return cached.ob
+            if cached.ob.is_session_active():
+                cached.validated_at = now
+                return cached.ob
+
+        token = Path(dir_pat).read_text().strip()
+        ob = pybis.Openbis(url)
+        ob.set_token(token)
+        with _SESSION_LOCK:
+            _SESSION_CACHE[key] = _CachedSession(ob=ob, pat_mtime=pat_mtime, validated_at=time.monotonic())
+        return ob
+
+def clear_openbis_cache() -> None:
+    """Forget all cached openBIS sessions, so that the next `get_openbis_obj` builds a new one."""
+    with _SESSION_LOCK:
+        _SESSION_CACHE.clear()
 
 def get_permid_specific_type(
         experiment_name:str,
@@ -91,40 +342,328 @@ def get_permid_specific_type(
         str: The permId of the dataset.
 
     """
-    ob = openbis_obj
-    # Construct the experiment identifier
-    experiment_identifier = f"{default_space}/{experiment_name.upper()}"
+    key = (experiment_name, dataset_type)
+    return get_permids([key], openbis_obj, default_space=default_space)[key]
 
-    # Get the experiment object
-    experiment = ob.get_experiment(experiment_identifier)
+def get_permids(
+        pairs: Iterable[tuple[str, str]],
+        openbis_obj: pybis.Openbis,
+        default_space: str = "/TEST_SPACE_PYBIS/TEST_UPLOAD",
+        strict: bool = True,
+        batch_size: int = 500,
+    ) -> dict[tuple[str, str], str | None]:
+    """Retrieve the permIds of the datasets of given types in many experiments at once.
 
-    # Retrieve datasets associated with the experiment
-    datasets = experiment.get_datasets()
+    The type filter is applied by the openBIS search, and all experiments asking for the same dataset type are
+    resolved in one query (per `batch_size` experiments). Results are memoized, since permIds never change.
 
-    # Filter datasets by type, comparing in uppercase
-    filtered_datasets = [ds for ds in datasets if ds.type.code.upper() == dataset_type.upper()]
+    Args:
+        pairs (Iterable[tuple[str, str]]): (experiment_name, dataset_type) pairs, for example
+            ("240906_kigr_gen4_01", "premise_cucumber_raw_json").
+        openbis_obj (pybis.Openbis): The openBIS object.
+        default_space (str): The default space to search in.
+        strict (bool, optional): Raise if a pair has no or several datasets. If False, such pairs map to None.
+            Defaults to True.
+        batch_size (int, optional): Maximum number of experiments per query. Defaults to 500.
 
-    # Extract permIds from the filtered datasets
-    perm_ids = [ds.permId for ds in filtered_datasets]
+    Returns:
+        dict[tuple[str, str], str | None]: The permId for each pair.
 
-    if len(perm_ids) == 0:
-        msg = f"No datasets of type '{dataset_type}' found in experiment '{experiment_name}'"
-        raise ValueError(msg)
-    if len(perm_ids) > 1:
-        msg = f"Multiple datasets of type '{dataset_type}' found in experiment '{experiment_name}'"
-        raise ValueError(msg)
+    Raises:
+        ValueError: In strict mode, if no dataset or more than one dataset of the type is found in an experiment.
+
+    """
+    pairs = list(dict.fromkeys(pairs))
+
+    def cache_key(pair: tuple[str, str]) -> tuple[str, str]:
+        # Ensures names are uppercase as required by openBIS.
+        return (f"{default_space}/{pair[0]}".upper(), pair[1].upper())
+
+    with _PERMID_LOCK:
+        missing = [pair for pair in pairs if cache_key(pair) not in _PERMID_CACHE]
+
+    # Group the unresolved experiments by dataset type, one search per type and batch of experiments.
+    by_type: dict[str, list[str]] = {}
+    for pair in missing:
+        experiment_identifier, dataset_type = cache_key(pair)
+        by_type.setdefault(dataset_type, []).append(experiment_identifier)
+
+    found: dict[tuple[str, str], list[str]] = {}
+    for dataset_type, experiment_identifiers in by_type.items():
+        for i in range(0, len(experiment_identifiers), batch_size):
+            datasets = openbis_obj.get_datasets(
+                type=dataset_type, experiment=experiment_identifiers[i:i + batch_size],
+            ).df
+            for perm_id, experiment_identifier in zip(
+                datasets.get("permId", []), datasets.get("experiment", []), strict=True,
+            ):
+                found.setdefault((str(experiment_identifier).upper(), dataset_type), []).append(perm_id)
+
+    with _PERMID_LOCK:
+        for key, perm_ids in found.items():
+            if len(perm_ids) == 1:
+                _PERMID_CACHE[key] = perm_ids[0]
+
+    result = {}
+    for experiment_name, dataset_type in pairs:
+        key = cache_key((experiment_name, dataset_type))
+        with _PERMID_LOCK:
+            perm_id = _PERMID_CACHE.get(key)
+        if perm_id is None and strict:
+            if len(found.get(key, [])) > 1:
+                msg = f"Multiple datasets of type '{dataset_type}' found in experiment '{experiment_name}'"
+            else:
+                msg = f"No datasets of type '{dataset_type}' found in experiment '{experiment_name}'"
+            raise ValueError(msg)
+        result[(experiment_name, dataset_type)] = perm_id
+    return result
+
+@dataclass
+class ExperimentState:
+    """The current properties and datasets of an openBIS experiment, as fetched by `get_experiment_state`."""
+
+    identifier: str
+    properties: dict[str, str]
+    datasets: dict[str, list[str]]
+
+
+def _experiment_id(identifier: str) -> dict:
+    return {"@type": "as.dto.experiment.id.ExperimentIdentifier", "identifier": identifier.upper()}
+
+
+def get_experiment_state(openbis_obj: pybis.Openbis, experiment_identifier: str) -> ExperimentState | None:
+    """Fetch the properties and the datasets of an experiment in a single openBIS call.
+
+    Args:
+        openbis_obj (pybis.Openbis): The openBIS object.
+        experiment_identifier (str): The experiment identifier, e.g. /TEST_SPACE_PYBIS/TEST_UPLOAD/240906_KIGR_GEN4_01.
+
+    Returns:
+        ExperimentState | None: The property values by upper-case code and the dataset permIds by upper-case
+            dataset type, or None if there is no such experiment.
+
+    """
+    fetch_options = {
+        "@type": "as.dto.experiment.fetchoptions.ExperimentFetchOptions",
+        "properties": {"@type": "as.dto.property.fetchoptions.PropertyFetchOptions"},
+        "dataSets": {
+            "@type": "as.dto.dataset.fetchoptions.DataSetFetchOptions",
+            "type": {"@type": "as.dto.dataset.fetchoptions.DataSetTypeFetchOptions"},
+        },
+    }
+    request = {
+        "method": "getExperiments",
+        "params": [openbis_obj.token, [_experiment_id(experiment_identifier)], fetch_options],
+    }
+    resp = openbis_obj._post_request(openbis_obj.as_v3, request)
+    if not resp:
+        return None
+    parse_jackson(resp)
+    data = next(iter(resp.values()))
+    datasets: dict[str, list[str]] = {}
+    for dataset in data.get("dataSets") or []:
+        datasets.setdefault(dataset["type"]["code"].upper(), []).append(dataset["permId"]["permId"])
+    return ExperimentState(
+        identifier=data["identifier"]["identifier"],
+        properties={code.upper(): value for code, value in (data.get("properties") or {}).items()},
+        datasets=datasets,
+    )
+
+
+def update_experiment_properties(openbis_obj: pybis.Openbis, experiment_identifier: str, properties: dict) -> None:
+    """Write the given properties of an existing experiment in a single openBIS call, leaving the others as they are.
+
+    Args:
+        openbis_obj (pybis.Openbis): The openBIS object.
+        experiment_identifier (str): The experiment identifier.
+        properties (dict): The new values by property code. None clears a property.
+
+    """
+    update = {
+        "@type": "as.dto.experiment.update.ExperimentUpdate",
+        "experimentId": _experiment_id(experiment_identifier),
+        "properties": {code.upper(): value for code, value in properties.items()},
+    }
+    request = {"method": "updateExperiments", "params": [openbis_obj.token, [update]]}
+    openbis_obj._post_request(openbis_obj.as_v3, request)
+
+
+def delete_datasets(openbis_obj: pybis.Openbis, perm_ids: Iterable[str], reason: str) -> None:
+    """Move several datasets to the openBIS trash in a single call.
+
+    Args:
+        openbis_obj (pybis.Openbis): The openBIS object.
+        perm_ids (Iterable[str]): The permIds of the datasets.
+        reason (str): The reason recorded with the deletion.
+
+    """
+    perm_ids = list(perm_ids)
+    if not perm_ids:
+        return
+    request = {
+        "method": "deleteDataSets",
+        "params": [
+            openbis_obj.token,
+            [{"@type": "as.dto.dataset.id.DataSetPermId", "permId": perm_id} for perm_id in perm_ids],
+            {"@type": "as.dto.dataset.delete.DataSetDeletionOptions", "reason": reason},
+        ],
+    }
+    openbis_obj._post_request(openbis_obj.as_v3, request)
+    deleted = set(perm_ids)
+    with _PERMID_LOCK:
+        for key in [key for key, perm_id in _PERMID_CACHE.items() if perm_id in deleted]:
+            del _PERMID_CACHE[key]
+
+def _download_dataset(openbis_obj: pybis.Openbis, perm_id: str, destination: str) -> str:
+    """Download a dataset into `destination` and return the path of its (first) file."""
+    dataset = openbis_obj.get_dataset(perm_id)
+    dataset.download(destination=destination, create_default_folders=True)
+    dir_downloaded = os.path.join(destination, perm_id, "original")
+    downloaded_filename = os.listdir(dir_downloaded)[0]
+    return os.path.join(dir_downloaded, downloaded_filename)
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """Hard link a file, falling back to a copy, e.g. across file systems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class DownloadCache:
+    """Persistent local cache of downloaded datasets, keyed by permId.
+
+    Datasets are immutable in openBIS, so a dataset downloaded once can be served from disk for every later call.
+    The cache is limited to `max_bytes`, evicting the least recently used datasets first. Downloads go to a
+    temporary folder and are moved into place atomically, so concurrent threads or processes sharing the cache
+    never see a partial download. Callers get their own hard-linked copy of the file through `checkout`.
+
+    Eviction only knows the checkouts of this instance, so a folder should be used by a single `DownloadCache`
+    shared by the threads of one process. Another instance, e.g. in another process, may evict a dataset between
+    its download and its checkout here.
+
+    Args:
+        root (str): The folder of the cache.
+        max_bytes (int, optional): The size limit of the cache in bytes. Defaults to 50 GiB.
+
+    """
+
+    def __init__(self, root: str = "dataset_cache", max_bytes: int = 50 * 1024**3) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Locks of the permIds being fetched, with the number of threads using each, removed when unused.
+        self._perm_id_locks: dict[str, threading.Lock] = {}
+        self._lock_users: Counter = Counter()
+        self._in_use: Counter = Counter()
+
+    def _entry(self, perm_id: str) -> Path:
+        return self.root / perm_id
+
+    def _get(self, openbis_obj: pybis.Openbis, perm_id: str) -> Path:
+        """Get the path of the cached file of a dataset, downloading it if it is not cached yet.
+
+        The file may be evicted as soon as it is not checked out, so this is only called by `checkout`.
+        """
+        with self._lock:
+            perm_id_lock = self._perm_id_locks.setdefault(perm_id, threading.Lock())
+            self._lock_users[perm_id] += 1
+        try:
+            with perm_id_lock:
+                return self._get_locked(openbis_obj, perm_id)
+        finally:
+            with self._lock:
+                self._lock_users[perm_id] -= 1
+                if not self._lock_users[perm_id]:
+                    del self._lock_users[perm_id]
+                    del self._perm_id_locks[perm_id]
+
+    def _get_locked(self, openbis_obj: pybis.Openbis, perm_id: str) -> Path:
+        """Get the cached file of a dataset while holding the lock of its permId."""
+        entry = self._entry(perm_id)
+        if not entry.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_destination = self.root / f".download-{uuid.uuid4().hex}"
+            try:
+                _download_dataset(openbis_obj, perm_id, str(tmp_destination))
+                try:
+                    (tmp_destination / perm_id).rename(entry)
+                except OSError:
+                    if not entry.exists():  # Otherwise another process was faster
+                        raise
+            finally:
+                shutil.rmtree(tmp_destination, ignore_errors=True)
+            self.evict(keep=perm_id)
+        os.utime(entry)  # Mark as recently used
+        dir_downloaded = entry / "original"
+        return next(dir_downloaded.iterdir())
+
+    @contextmanager
+    def checkout(self, openbis_obj: pybis.Openbis, perm_id: str) -> Iterator[Path]:
+        """Provide a private copy of the cached file of a dataset, removed when the context exits.
+
+        The copy is hard linked where possible, so it costs no extra space or time, and changes made to it by the
+        caller cannot corrupt the cache.
+        """
+        with self._lock:
+            self._in_use[perm_id] += 1
+        call_dir = None
+        try:
+            cached_path = self._get(openbis_obj, perm_id)
+            self.root.mkdir(parents=True, exist_ok=True)
+            call_dir = Path(tempfile.mkdtemp(prefix=".checkout-", dir=self.root))
+            call_path = call_dir / cached_path.name
+            if cached_path.is_dir():
+                shutil.copytree(cached_path, call_path, copy_function=_link_or_copy)
+            else:
+                _link_or_copy(cached_path, call_path)
+            yield call_path
+        finally:
+            if call_dir is not None:
+                shutil.rmtree(call_dir, ignore_errors=True)
+            with self._lock:
+                self._in_use[perm_id] -= 1
+                if not self._in_use[perm_id]:
+                    del self._in_use[perm_id]
+
+    def evict(self, keep: str | None = None) -> None:
+        """Remove the least recently used datasets until the cache is within its size limit.
 
-    return perm_ids[0]
+        Datasets checked out through this instance are kept.
+        """
+        entries = []
+        total_bytes = 0
+        for entry in self.root.iterdir():
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            size = sum(f.stat().st_size for f in entry.rglob("*") if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry))
+            total_bytes += size
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            with self._lock:
+                in_use = self._in_use[entry.name] > 0
+            if in_use or entry.name == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total_bytes -= size
 
 # This trick will download the file, pass the path to the decorated function, and clean up the file afterward.
-def with_downloaded_file(openbis_obj: pybis.Openbis, destination: str = "temp_files") -> callable:
+def with_downloaded_file(
+        openbis_obj: pybis.Openbis,
+        destination: str = "temp_files",
+        cache: DownloadCache | None = None,
+    ) -> callable:
     """Generate decorator function to handle file downloads.
 
-    Download file, pass path and permID to decorated function, then remove file.
+    Download file, pass path and permID to decorated function, then remove file. Every call downloads into its own
+    folder below `destination`, so concurrent calls do not interfere. With a `cache`, the dataset is downloaded only
+    once and later calls are served from the cache.
 
     Args:
         openbis_obj: The OpenBIS object.
         destination: The base folder where files will be downloaded.
+        cache: A persistent download cache to serve the datasets from.
 
     Returns:
         Decorated function that receives the path to the downloaded file and the permId as arguments.
@@ -133,19 +672,19 @@ def with_downloaded_file(openbis_obj: pybis.Openbis, destination: str = "temp_fi
     def decorator(func: callable) -> callable:
         @wraps(func)
         def wrapper(perm_id: str, *args: dict, **kwargs: dict) -> any:
-            # Download the dataset
-            dataset = openbis_obj.get_dataset(perm_id)
-            dataset.download(destination=destination, create_default_folders=True)
-            dir_downloaded = os.path.join(destination, perm_id, "original")
-            downloaded_filename = os.listdir(dir_downloaded)[0]
-            path_downloaded_file = os.path.join(dir_downloaded, downloaded_filename)
+            if cache is not None:
+                with cache.checkout(openbis_obj, perm_id) as path_downloaded_file:
+                    return func(str(path_downloaded_file), perm_id, *args, **kwargs)
 
+            Path(destination).mkdir(parents=True, exist_ok=True)
+            call_destination = tempfile.mkdtemp(dir=destination)
             try:
-                # Call the decorated function with the downloaded file path and permId
+                # Download the dataset and call the decorated function with the downloaded file path and permId
+                path_downloaded_file = _download_dataset(openbis_obj, perm_id, call_destination)
                 result = func(path_downloaded_file, perm_id, *args, **kwargs)
             finally:
                 # Clean up: Delete the downloaded files
-                shutil.rmtree(os.path.join(destination, perm_id))
+                shutil.rmtree(call_destination)
             return result
         return wrapper
     return decorator
@@ -0,0 +1,95 @@
+"""Local upload manifest, used to resume interrupted pushes without uploading finished stages again."""
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+MANIFEST_NAME = ".obvibe_manifest"
+
+
+def file_fingerprint(path: str | Path, previous: dict | None = None) -> dict:
+    """Get the size, modification time and SHA-256 of a file.
+
+    The hash is only recomputed if the size or modification time differ from `previous`, so checking a large,
+    unchanged file is cheap.
+
+    Args:
+        path (str | Path): The file to fingerprint.
+        previous (dict, optional): A fingerprint of the same file from an earlier run.
+
+    Returns:
+        dict: The keys "size", "mtime_ns" and "sha256".
+
+    """
+    stat = Path(path).stat()
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": previous["sha256"]}
+    sha = hashlib.sha256()
+    with Path(path).open("rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha.update(chunk)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha.hexdigest()}
+
+
+@dataclass
+class UploadManifest:
+    """Record of the push stages finished for one experiment folder.
+
+    Each stage stores the content hashes of the files it was based on and the openBIS permId it produced. The
+    manifest is written to disk after every finished stage.
+    """
+
+    path: Path
+    experiment_identifier: str | None = None
+    stages: dict[str, dict] = field(default_factory=dict)
+    files: dict[str, dict] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @classmethod
+    def load(cls, dir_folder: str | Path) -> "UploadManifest":
+        """Load the manifest of an experiment folder, or start an empty one if there is none."""
+        path = Path(dir_folder) / MANIFEST_NAME
+        if not path.exists():
+            return cls(path=path)
+        with path.open() as f:
+            content = json.load(f)
+        return cls(
+            path=path,
+            experiment_identifier=content.get("experiment_identifier"),
+            stages=content.get("stages", {}),
+            files=content.get("files", {}),
+        )
+
+    def save(self) -> None:
+        """Write the manifest atomically."""
+        content = {"experiment_identifier": self.experiment_identifier, "stages": self.stages, "files": self.files}
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(content, f, indent=4)
+        tmp_path.replace(self.path)
+
+    def is_done(self, stage: str, inputs: dict | None = None) -> bool:
+        """Check if a stage finished, and if given, whether it was based on the same input hashes."""
+        with self._lock:
+            entry = self.stages.get(stage)
+        if entry is None:
+            return False
+        return inputs is None or entry.get("inputs") == inputs
+
+    def mark_done(self, stage: str, inputs: dict | None = None, perm_id: str | None = None) -> None:
+        """Record a finished stage and save the manifest."""
+        with self._lock:
+            self.stages[stage] = {"inputs": inputs, "perm_id": perm_id}
+            self.save()
+
+    def fingerprint(self, path: str | Path) -> str:
+        """Get the SHA-256 of a file in the folder, reusing the recorded hash if the file looks unchanged."""
+        name = Path(path).name
+        with self._lock:
+            previous = self.files.get(name)
+        fingerprint = file_fingerprint(path, previous)
+        with self._lock:
+            self.files[name] = fingerprint
+        return fingerprint["sha256"]
@@ -1,13 +1,26 @@
-"""Functions to handle ontology xlsx file generation and upload."""
+"""Functions to handle ontology xlsx file generation and upload.
 
+openpyxl and the JSON-LD converter, which needs pandas, are imported by the functions that use them.
+"""
+
+from __future__ import annotations
+
+import gzip
 import json
 import shutil
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING, TextIO
+
+from . import analyzed_json, instrumentation, pathfolio
 
-from openpyxl import load_workbook
+if TYPE_CHECKING:
+    from openpyxl.worksheet.worksheet import Worksheet
 
-from . import pathfolio, simon_simulator
+DEFAULT_TEMPLATE = r"K:\Aurora\nukorn_PREMISE_space\Battinfo_template.xlsx"
+
+# File name suffix added for each supported JSON-LD compression.
+JSONLD_COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
 
 
 def update_metadata_value(file_path: str, metadata: str, input_value: str, sheet_name: str = "Schema"):
@@ -20,6 +33,8 @@ def update_metadata_value(file_path: str, metadata: str, input_value: str, sheet
         sheet_name (str): Name of the sheet to search in (default is "Schema").
 
     """
+    from openpyxl import load_workbook
+
     try:
         # Load the workbook and select the specified sheet
         workbook = load_workbook(file_path)
@@ -45,10 +60,92 @@ def update_metadata_value(file_path: str, metadata: str, input_value: str, sheet
     except Exception as e:
         print(f"An error occurred: {e}")
 
+def update_metadata_values(file_path: str, dict_metadata: dict, sheet_name: str = "Schema") -> list[str]:
+    """Update the values of several metadata keys in an Excel sheet, loading and saving the workbook only once.
+
+    Args:
+        file_path (str): Path to the Excel file.
+        dict_metadata (dict): The metadata keys to search for and the new values to set.
+        sheet_name (str): Name of the sheet to search in (default is "Schema").
+
+    Returns:
+        list[str]: The metadata keys that were not found in the sheet.
+
+    Raises:
+        ValueError: If the sheet does not exist in the workbook.
+
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path)
+    if sheet_name not in workbook.sheetnames:
+        msg = f"Sheet '{sheet_name}' not found in the workbook."
+        raise ValueError(msg)
+    not_found = _apply_metadata_values(workbook[sheet_name], dict_metadata)
+    workbook.save(file_path)
+    return not_found
+
+def _apply_metadata_values(sheet: Worksheet, dict_metadata: dict) -> list[str]:
+    """Set the values of metadata keys in a Schema sheet and return the keys that were not found."""
+    # Index the value cell of each metadata key, the first occurrence wins as in update_metadata_value.
+    value_cells = {}
+    for metadata_cell, value_cell in sheet.iter_rows(min_row=2, max_row=sheet.max_row, min_col=1, max_col=2):
+        value_cells.setdefault(metadata_cell.value, value_cell)
+
+    not_found = []
+    for metadata, input_value in dict_metadata.items():
+        value_cell = value_cells.get(metadata)
+        if value_cell is None:
+            not_found.append(metadata)
+            continue
+        value_cell.value = input_value
+    return not_found
+
+def read_custom_values(dir_custom: str) -> dict[str, object]:
+    """Read the non-empty values of the Schema sheet of a custom metadata Excel file, by Metadata name.
+
+    The workbook is streamed in read-only mode, so the time and memory do not depend on the formatting of the sheet.
+    If a Metadata name occurs several times, its first non-empty value is used.
+
+    Args:
+        dir_custom (str): The path to the custom metadata Excel file.
+
+    Returns:
+        dict[str, object]: The non-empty values by Metadata name.
+
+    Raises:
+        ValueError: If the "Schema" sheet has no "Value" column.
+
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(dir_custom, read_only=True)
+    try:
+        rows = workbook["Schema"].iter_rows(values_only=True)
+        header = next(rows, ())
+        if "Value" not in header:
+            msg = "Column 'Value' not found in the 'Schema' sheet."
+            raise ValueError(msg)
+        value_column = header.index("Value")
+        metadata_column = header.index("Metadata") if "Metadata" in header else 0
+
+        custom_values = {}
+        for row in rows:
+            if len(row) <= max(metadata_column, value_column):
+                continue
+            metadata, custom_value = row[metadata_column], row[value_column]
+            if metadata is None or custom_value is None or custom_value == "":
+                continue
+            custom_values.setdefault(metadata, custom_value)
+        return custom_values
+    finally:
+        workbook.close()
+
 def gen_metadata_xlsx(
         dir_json: str,
         user_mapping: dict = None,
-        dir_template: str = r"K:\Aurora\nukorn_PREMISE_space\Battinfo_template.xlsx",
+        dir_template: str = DEFAULT_TEMPLATE,
+        sample_metadata: dict | None = None,
     ) -> None:
     r"""Generate a metadata Excel file for a specific experiment based on a template.
 
@@ -61,6 +158,8 @@ def gen_metadata_xlsx(
         dir_template (str): The path to the template Excel file. Defaults to
                             'K:\\Aurora\\nukorn_PREMISE_space\\Battinfo_template.xlsx'.
         user_mapping (dict, optional): A dictionary mapping user short names to full names.
+        sample_metadata (dict, optional): The "sample_data" section of the analyzed JSON file, if it was already
+            read. Otherwise it is read from `dir_json`.
 
     Returns:
         None: Creates a new Excel file in the backup directory with the experiment name as part of the file name.
@@ -76,12 +175,19 @@ def gen_metadata_xlsx(
     shutil.copy(dir_template, dir_new_xlsx)
 
     # Update the experiment name in the new Excel file
-    dict_metadata = curate_metadata_dict(dir_json, user_mapping=user_mapping)
-    for key, value in dict_metadata.items():
-        update_metadata_value(dir_new_xlsx, key, value)
+    with instrumentation.stage("curate_metadata"):
+        dict_metadata = curate_metadata_dict(dir_json, user_mapping=user_mapping, sample_metadata=sample_metadata)
+    with instrumentation.stage("write_xlsx"):
+        not_found = update_metadata_values(dir_new_xlsx, dict_metadata)
+    for key in not_found:
+        print(f"Metadata '{key}' not found in sheet 'Schema'.")
 
 
-def curate_metadata_dict(dir_json: str, user_mapping: dict | None = None) -> dict[str, str]:
+def curate_metadata_dict(
+        dir_json: str,
+        user_mapping: dict | None = None,
+        sample_metadata: dict | None = None,
+    ) -> dict[str, str]:
     """Generate a metadata dictionary by extracting relevant information from a JSON file.
 
     This metadata is used to populate an Excel file that will later generate an
@@ -90,6 +196,8 @@ def curate_metadata_dict(dir_json: str, user_mapping: dict | None = None) -> dic
     Args:
         dir_json (str): The file path to the JSON file that contains the analyzed metadata.
         user_mapping (dict, optional): A dictionary mapping user short names to full names.
+        sample_metadata (dict, optional): The "sample_data" section of the JSON file, if it was already read.
+            Otherwise only that section is read from `dir_json`, see `analyzed_json.read_sample_data`.
 
     Returns:
         Dict[str, str]: A dictionary containing metadata items as keys and their corresponding values.
@@ -100,8 +208,8 @@ def curate_metadata_dict(dir_json: str, user_mapping: dict | None = None) -> dic
     """
     dict_metadata = {}
 
-    with Path(dir_json).open() as f:
-        sample_metadata = json.load(f)["metadata"]["sample_data"]
+    if sample_metadata is None:
+        sample_metadata = analyzed_json.read_sample_data(dir_json)
 
     #Extract metadata from the analyzed json file.
     for key, value in pathfolio.dict_excel_to_json.items():
@@ -126,21 +234,147 @@ def curate_metadata_dict(dir_json: str, user_mapping: dict | None = None) -> dic
         raise ValueError(msg)
     return dict_metadata
 
-def gen_jsonld(dir_xlsx: str,  jsonld_filename: str) -> None:
+def gen_jsonld(
+        dir_xlsx: str,
+        jsonld_filename: str,
+        dir_template: str | None = None,
+        indent: int | None = 4,
+        compression: str | None = None,
+    ) -> Path:
     """Generate a JSON-LD file from a metadata Excel file.
 
     Args:
         dir_xlsx (str): The path to the metadata Excel file.
         jsonld_filename (str): The name of the JSON-LD file.
+        dir_template (str, optional): The template the metadata Excel file was made from. If given, only the
+            Schema sheet of the metadata Excel file is read and the other sheets come from the cached template.
+        indent (int | None, optional): The indentation of the JSON-LD file. None writes compact JSON without any
+            whitespace. Defaults to 4.
+        compression (str | None, optional): "gzip", or "zstd" if the zstandard package is installed, to write a
+            compressed file with the suffix ".gz" or ".zst" appended to `jsonld_filename`. Defaults to None.
 
     Returns:
-        None: Creates a new JSON-LD file in the specified directory.
+        Path: The path to the JSON-LD file, created in the directory of the metadata Excel file.
 
     """
+    from . import simon_simulator
+
     dir_xlsx = Path(dir_xlsx)
-    json_ld_output = simon_simulator.convert_excel_to_jsonld(dir_xlsx)
-    jsonld_str = json.dumps(json_ld_output, indent=4)
-    jsonld_filepath = dir_xlsx.parent/jsonld_filename
+    with instrumentation.stage("build_jsonld"):
+        json_ld_output = simon_simulator.convert_excel_to_jsonld(dir_xlsx, template_file=dir_template)
+    return _write_jsonld(json_ld_output, dir_xlsx.parent/jsonld_filename, indent=indent, compression=compression)
+
+def _write_jsonld(
+        json_ld_output: dict,
+        jsonld_filepath: Path,
+        indent: int | None = 4,
+        compression: str | None = None,
+    ) -> Path:
+    """Serialize the JSON-LD document straight into the (compressed) file and return its path.
+
+    The document is written to a temporary file that then replaces the target, so readers never see a partial file.
+    """
+    if compression is not None:
+        if compression not in JSONLD_COMPRESSION_SUFFIXES:
+            msg = f"Unknown compression '{compression}', use one of {', '.join(JSONLD_COMPRESSION_SUFFIXES)}."
+            raise ValueError(msg)
+        suffix = JSONLD_COMPRESSION_SUFFIXES[compression]
+        if not jsonld_filepath.name.endswith(suffix):
+            jsonld_filepath = jsonld_filepath.with_name(jsonld_filepath.name + suffix)
+    separators = None if indent is not None else (",", ":")
+    tmp_path = jsonld_filepath.with_name(jsonld_filepath.name + ".tmp")
+    with instrumentation.stage("write_jsonld"):
+        try:
+            with _open_text(tmp_path, compression) as f:
+                json.dump(json_ld_output, f, indent=indent, separators=separators)
+            tmp_path.replace(jsonld_filepath)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    return jsonld_filepath
+
+def _open_text(path: Path, compression: str | None) -> TextIO:
+    """Open a file for writing text, compressing it on the fly if requested."""
+    if compression == "gzip":
+        return gzip.open(path, "wt", encoding="utf-8")
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            msg = "zstd compression needs the zstandard package, install obvibe[zstd]."
+            raise ImportError(msg) from None
+        return zstandard.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def gen_metadata_and_jsonld(
+        dir_json: str,
+        user_mapping: dict | None = None,
+        dir_template: str = DEFAULT_TEMPLATE,
+        dir_custom: str | None = None,
+        sample_metadata: dict | None = None,
+        indent: int | None = 4,
+        compression: str | None = None,
+    ) -> tuple[Path, Path]:
+    r"""Generate the merged metadata Excel file and the ontologized JSON-LD file of an experiment in one pass.
+
+    The metadata extracted from the analyzed json file and the values of the custom metadata file are merged into
+    the template schema in memory, and the JSON-LD is built directly from that. The template is read once and the
+    merged Excel file is only written as an output, it is not read back.
+
+    Args:
+        dir_json (str): The path to the analyzed JSON file.
+        user_mapping (dict, optional): A dictionary mapping user short names to full names.
+        dir_template (str): The path to the template Excel file. Defaults to
+                            'K:\Aurora\nukorn_PREMISE_space\Battinfo_template.xlsx'.
+        dir_custom (str, optional): The path to a custom metadata Excel file whose non-empty values override the
+            values of the template and the analyzed JSON file with the same Metadata name.
+        sample_metadata (dict, optional): The "sample_data" section of the analyzed JSON file, if it was already
+            read. Otherwise it is read from `dir_json`.
+        indent (int | None, optional): The indentation of the JSON-LD file, None for compact JSON. Defaults to 4.
+        compression (str | None, optional): Compress the JSON-LD file with "gzip" or "zstd", see `gen_jsonld`.
+            Defaults to None.
+
+    Returns:
+        tuple[Path, Path]: The paths to `<exp>_merged_metadata.xlsx` and `ontologized_<exp>.json`, with the suffix
+            of the compression if any, written next to the analyzed JSON file.
 
-    with open(jsonld_filepath, "w") as f:
-        f.write(jsonld_str)
+    """
+    import numpy as np
+    from openpyxl import load_workbook
+
+    from . import simon_simulator
+
+    dir_json = Path(dir_json)
+    experiment_name = dir_json.stem.split(".")[1]
+    with instrumentation.stage("curate_metadata"):
+        dict_metadata = curate_metadata_dict(dir_json, user_mapping=user_mapping, sample_metadata=sample_metadata)
+    with instrumentation.stage("read_custom"):
+        custom_values = read_custom_values(dir_custom) if dir_custom is not None else {}
+    # The custom values take precedence over the extracted ones.
+    merged_metadata = {**dict_metadata, **custom_values}
+
+    # Write the merged Excel file as an output, loading and saving the template once.
+    dir_xlsx = dir_json.parent / f"{experiment_name}_merged_metadata.xlsx"
+    with instrumentation.stage("write_xlsx"):
+        workbook = load_workbook(dir_template)
+        not_found = _apply_metadata_values(workbook["Schema"], merged_metadata)
+        workbook.save(dir_xlsx)
+    for key in not_found:
+        print(f"Metadata '{key}' not found in sheet 'Schema'.")
+
+    # Apply the same values to the schema read by pandas, as if the merged Excel file was read back.
+    with instrumentation.stage("build_jsonld"):
+        template = simon_simulator.load_template(dir_template)
+        schema = template.data["schema"].copy()
+        schema["Value"] = schema["Value"].astype(object)
+        first_index = {}
+        for index, metadata in schema["Metadata"].items():
+            first_index.setdefault(metadata, index)
+        for metadata, value in merged_metadata.items():
+            if metadata in first_index:
+                schema.loc[first_index[metadata], "Value"] = np.nan if value is None else value
+
+        json_ld_output = simon_simulator.create_jsonld_with_conditions(template.with_schema(schema))
+    dir_jsonld = _write_jsonld(
+        json_ld_output, dir_json.parent / f"ontologized_{experiment_name}.json", indent=indent, compression=compression,
+    )
+    return dir_xlsx, dir_jsonld
@@ -5,11 +5,18 @@ The functions required here are copied from NukP/BattInfoConverter
 commit a8cb3fd732a3bf0604e7042bef8bb6d0dda1578a, version 0.8.0
 When BattInfoConverter is ready, this module will be replaced by a BattInfoConverter import.
 """
+import copy
 import datetime
 import inspect
-import traceback
+import json
+import logging
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass, field
-from typing import Any
+from pathlib import Path
+from typing import IO, Any
 
 import numpy as np
 import pandas as pd
@@ -17,20 +24,133 @@ from pandas import DataFrame
 
 APP_VERSION = "1.0.0"
 
+logger = logging.getLogger(__name__)
+
+
+class ConversionTrace:
+    """Structured record of the path decisions taken by `add_to_structure`.
+
+    Each decision is kept in `records` and, if a file is given, also written to it as one JSON line.
+    """
+
+    def __init__(self, file: IO[str] | None = None) -> None:
+        self.records: list[dict] = []
+        self.file = file
+
+    def record(self, event: str, value: Any, part: Any, current_level: dict | None = None) -> None:
+        """Record a decision, with the line of `add_to_structure` that took it."""
+        entry = {
+            "line": inspect.currentframe().f_back.f_lineno,
+            "event": event,
+            "value": value,
+            "part": part,
+        }
+        if current_level is not None:
+            entry["current_level"] = current_level
+        self.records.append(entry)
+        if self.file is not None:
+            self.file.write(json.dumps(entry, default=str) + "\n")
+
+
+# Active trace of the current thread or task, None when tracing is off.
+_trace: ContextVar[ConversionTrace | None] = ContextVar("obvibe_conversion_trace", default=None)
+
+
+@contextmanager
+def trace_conversion(file: str | Path | IO[str] | None = None) -> Iterator[ConversionTrace]:
+    """Record the path decisions of the Excel to JSON-LD conversion while the context is active.
+
+    Tracing is off by default and then costs nothing beyond one context variable lookup per schema row.
+
+    Args:
+        file (str | Path | IO[str], optional): A path or text stream to write the decisions to as JSON lines.
+            If not given, they are only kept in memory.
+
+    Yields:
+        ConversionTrace: The trace, whose `records` list fills up during the conversion.
+
+    """
+    if isinstance(file, str | Path):
+        with Path(file).open("w") as f, trace_conversion(f) as trace:
+            yield trace
+        return
+    trace = ConversionTrace(file)
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+def read_excel_sheets(excel_file: str) -> dict[str, DataFrame]:
+    """Read the sheets needed for the JSON-LD conversion from a BattINFO Excel file."""
+    excel_data = pd.ExcelFile(excel_file)
+    return {
+        "schema": pd.read_excel(excel_data, "Schema"),
+        "unit_map": pd.read_excel(excel_data, "Ontology - Unit"),
+        "context_toplevel": pd.read_excel(excel_data, "@context-TopLevel"),
+        "context_connector": pd.read_excel(excel_data, "@context-Connector"),
+        "unique_id": pd.read_excel(excel_data, "Unique ID"),
+    }
+
 @dataclass
 class ExcelContainer:
-    excel_file: str
-    data: dict = field(init=False)
+    """Sheets of a BattINFO Excel file, read from `excel_file` unless `data` is given directly.
+
+    The lookups needed for every schema row are indexed once when the container is created:
+    `unit_index` maps a unit to its row of the "Ontology - Unit" sheet, `connector_index` maps a connector to its
+    type and `unique_id_index` maps an item to its unique ID. Other column-to-column lookups are indexed on first use
+    by `lookup`.
+    """
+
+    excel_file: str | None = None
+    data: dict | None = None
+    unit_index: dict = field(init=False, repr=False)
+    connector_index: dict = field(init=False, repr=False)
+    unique_id_index: dict = field(init=False, repr=False)
+    _indexes: dict = field(init=False, repr=False, default_factory=dict)
 
     def __post_init__(self):
-        excel_data = pd.ExcelFile(self.excel_file)
-        self.data = {
-            "schema": pd.read_excel(excel_data, "Schema"),
-            "unit_map": pd.read_excel(excel_data, "Ontology - Unit"),
-            "context_toplevel": pd.read_excel(excel_data, "@context-TopLevel"),
-            "context_connector": pd.read_excel(excel_data, "@context-Connector"),
-            "unique_id": pd.read_excel(excel_data, "Unique ID"),
-        }
+        if self.data is None:
+            self.data = read_excel_sheets(self.excel_file)
+        self.unit_index = self.data["unit_map"].set_index("Item").to_dict(orient="index")
+        self.connector_index = self.index("context_connector", "Item", "Key")
+        self.unique_id_index = self.index("unique_id", "Item", "ID")
+
+    def with_schema(self, schema: DataFrame) -> "ExcelContainer":
+        """Get a copy of the container with another Schema sheet, sharing the other sheets and their indexes."""
+        container = copy.copy(self)
+        container.data = {**self.data, "schema": schema}
+        container._indexes = {key: index for key, index in self._indexes.items() if key[0] != "schema"}
+        return container
+
+    def index(self, sheet: str, col_to_match: str, col_to_look: str) -> dict:
+        """Get the first-match index from `col_to_match` to `col_to_look` of a sheet, building it on first use."""
+        key = (sheet, col_to_match, col_to_look)
+        if key not in self._indexes:
+            self._indexes[key] = _first_match_index(self.data[sheet], col_to_match, col_to_look)
+        return self._indexes[key]
+
+    def lookup(
+            self,
+            sheet: str,
+            row_to_look: str,
+            col_to_look: str = "Value",
+            col_to_match: str = "Metadata",
+        ) -> str | None:
+        """Indexed equivalent of `get_information_value` on one of the sheets of the container."""
+        if isinstance(row_to_look, str) and row_to_look.endswith(" "):
+            row_to_look = row_to_look.rstrip(" ")
+        try:
+            return self.index(sheet, col_to_match, col_to_look).get(row_to_look)
+        except TypeError:  # Unhashable values cannot match any cell
+            return None
+
+def _first_match_index(df: DataFrame, col_to_match: str, col_to_look: str) -> dict:
+    """Map each value of `col_to_match` to the value of `col_to_look` in the first row where it appears."""
+    index = {}
+    for key, value in zip(df[col_to_match], df[col_to_look], strict=True):
+        index.setdefault(key, value)
+    return index
 
 def get_information_value(
         df: DataFrame,
@@ -52,7 +172,7 @@ def get_information_value(
     """
     if row_to_look.endswith(" "):  # Check if the string ends with a space
         row_to_look = row_to_look.rstrip(" ")  # Remove only trailing spaces
-    result = df.query(f"{col_to_match} == @row_to_look")[col_to_look]
+    result = df.loc[df[col_to_match] == row_to_look, col_to_look]
     return result.iloc[0] if not result.empty else None
 
 
@@ -89,20 +209,21 @@ def create_jsonld_with_conditions(data_container: ExcelContainer) -> dict:
     dict_harvested_info = {}
     #Harvest the required value from the schema sheet.
     for schema_field in ls_info_to_harvest:
-        if get_information_value(df=schema, row_to_look=schema_field) is np.nan:
+        harvested_value = data_container.lookup("schema", schema_field)
+        if harvested_value is np.nan:
             msg = f"Missing information in the schema, please fill in the field '{schema_field}'"
             raise ValueError(msg)
-        dict_harvested_info[schema_field] = get_information_value(df=schema, row_to_look=schema_field)
+        dict_harvested_info[schema_field] = harvested_value
 
     #Harvest unique ID value for the required value from the schema sheet.
     ls_id_info_to_harvest = [ "Institution/company", "Scientist/technician/operator"]
     dict_harvest_id = {}
     for uid in ls_id_info_to_harvest:
         try:
-            dict_harvest_id[uid] = get_information_value(df=data_container.data["unique_id"],
-                                                        row_to_look=dict_harvested_info[uid],
-                                                        col_to_look = "ID",
-                                                        col_to_match="Item")
+            dict_harvest_id[uid] = data_container.lookup("unique_id",
+                                                         row_to_look=dict_harvested_info[uid],
+                                                         col_to_look = "ID",
+                                                         col_to_match="Item")
             if dict_harvest_id[uid] is None:
                 msg = f"Missing unique ID for the field '{uid}'"
                 raise ValueError(msg)
@@ -113,7 +234,7 @@ def create_jsonld_with_conditions(data_container: ExcelContainer) -> dict:
     jsonld = {
         "@context": ["https://w3id.org/emmo/domain/battery/context", {}],
         "@type": dict_harvested_info["Cell type"],
-        "schema:version": get_information_value(df=schema, row_to_look="BattINFO CoinCellSchema version"),
+        "schema:version": data_container.lookup("schema", "BattINFO CoinCellSchema version"),
         "schema:productID": dict_harvested_info["Cell ID"],
         "schema:dateCreated": dict_harvested_info["Date of cell assembly"],
         "schema:creator": {
@@ -181,11 +302,48 @@ def create_jsonld_with_conditions(data_container: ExcelContainer) -> dict:
     )
     return jsonld
 
-def convert_excel_to_jsonld(excel_file: ExcelContainer) -> dict:
-    print("*********************************************************")
-    print(f"Initialize new session of Excel file conversion, started at {datetime.datetime.now()}")
-    print("*********************************************************")
-    data_container = ExcelContainer(excel_file)
+_TEMPLATE_CACHE: dict[tuple[str, int, int], ExcelContainer] = {}
+_TEMPLATE_LOCK = threading.Lock()
+
+def load_template(template_file: str | Path) -> ExcelContainer:
+    """Get the parsed sheets and indexes of a BattINFO template, parsing the file only once per process.
+
+    Parsed templates are cached in memory by path, modification time and size, so a changed template is parsed
+    again. The returned container is shared and must not be modified; use `ExcelContainer.with_schema` to combine
+    it with the schema of an experiment.
+
+    Args:
+        template_file (str | Path): The path to the template Excel file.
+
+    Returns:
+        ExcelContainer: The parsed template.
+
+    """
+    path = Path(template_file).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _TEMPLATE_LOCK:
+        cached = _TEMPLATE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    container = ExcelContainer(str(path))
+    with _TEMPLATE_LOCK:
+        _TEMPLATE_CACHE[key] = container
+    return container
+
+def convert_excel_to_jsonld(excel_file: ExcelContainer, template_file: str | Path | None = None) -> dict:
+    """Convert a BattINFO Excel file to a JSON-LD dictionary.
+
+    If the template the file was made from is given, only its Schema sheet is read and the other sheets are taken
+    from the cached template, see `load_template`.
+    """
+    logger.info("Initialize new session of Excel file conversion, started at %s", datetime.datetime.now())
+    if template_file is None:
+        data_container = ExcelContainer(excel_file)
+    else:
+        schema = pd.read_excel(excel_file, "Schema")
+        data_container = load_template(template_file).with_schema(schema)
 
     # Generate JSON-LD using the data container
     return create_jsonld_with_conditions(data_container)
@@ -213,46 +371,44 @@ def add_to_structure(jsonld: dict, path: list[str], value: Any, unit: str, data_
         RuntimeError: If any unexpected error arises while processing the value and path.
 
     """
+    trace = _trace.get()
     try:
-        print("               ")  # Debug separator
         current_level = jsonld
-        unit_map = data_container.data["unit_map"].set_index("Item").to_dict(orient="index")
-        context_connector = data_container.data["context_connector"]
-        connectors = set(context_connector["Item"])
-        unique_id = data_container.data["unique_id"]
+        unit_map = data_container.unit_index
+        connectors = data_container.connector_index
 
         # Skip processing if value is invalid
         if not value or pd.isna(value):
-            print(f"Skipping empty value for path: {path}")
+            if trace is not None:
+                trace.record("skip_empty", value, path)
             return
 
         for idx, parts in enumerate(path):
             if len(parts.split("|")) == 1:
                 part = parts
                 special_command = None
-                plf(value, part)
+                if trace is not None:
+                    trace.record("part", value, part)
 
             elif "type|" in parts:
                 # Handle "type|" special command
                 _, type_value = parts.split("|", 1)
-                plf(value, type_value)
 
                 # Assign type value only if it's valid
                 if type_value:
                     current_level["@type"] = type_value
-                plf(value, type_value, current_level=current_level)
+                if trace is not None:
+                    trace.record("type", value, type_value, current_level=dict(current_level))
                 continue
 
             elif len(parts.split("|")) == 2:
                 special_command, part = parts.split("|")
-                plf(value, part)
+                if trace is not None:
+                    trace.record("special_command", value, parts)
                 if special_command == "rev":
-                    plf(value, part)
                     if "@reverse" not in current_level:
-                        plf(value, part)
                         current_level["@reverse"] = {}
                     current_level = current_level["@reverse"]
-                    plf(value, part)
 
             else:
                 msg = f"Invalid JSON-LD at: {parts} in {path}"
@@ -262,9 +418,10 @@ def add_to_structure(jsonld: dict, path: list[str], value: Any, unit: str, data_
             is_second_last = idx == len(path) - 2
 
             if (part not in current_level) and (value or unit):  # Only add the part if value or unit exists
-                plf(value, part)
+                if trace is not None:
+                    trace.record("new_node", value, part)
                 if part in connectors:
-                    connector_type = context_connector.loc[context_connector["Item"] == part, "Key"].values[0]
+                    connector_type = connectors[part]
                     if pd.isna(connector_type):
                         current_level[part] = {}
                     else:
@@ -294,9 +451,9 @@ def add_to_structure(jsonld: dict, path: list[str], value: Any, unit: str, data_
 
             # Handle final value assignment
             if is_last and unit == "No Unit":
-                if value in unique_id["Item"].values:
-                    unique_id_of_value = get_information_value(
-                        df=unique_id, row_to_look=value, col_to_look="ID", col_to_match="Item",
+                if value in data_container.unique_id_index:
+                    unique_id_of_value = data_container.lookup(
+                        "unique_id", row_to_look=value, col_to_look="ID", col_to_match="Item",
                     )
                     if not pd.isna(unique_id_of_value):  # Only assign if the ID is valid
                         current_level["@id"] = unique_id_of_value
@@ -308,19 +465,6 @@ def add_to_structure(jsonld: dict, path: list[str], value: Any, unit: str, data_
             current_level = current_level[part]
 
     except Exception as e:
-        traceback.print_exc()  # Print the full traceback
+        logger.debug("Error while adding value %r at path %s", value, path, exc_info=True)
         msg = f"Error occurred with value '{value}' and path '{path}': {e!s}"
         raise RuntimeError(msg)
-
-
-def plf(value, part, current_level = None, debug_switch = True):
-    """Print line function used for debugging."""
-    if debug_switch:
-        current_frame = inspect.currentframe()
-        line_number = current_frame.f_back.f_lineno
-        if current_level is not None:
-            print(f"pass line {line_number}, value:", value,"AND part:", part, "AND current_level:", current_level)
-        else:
-            print(f"pass line {line_number}, value:", value,"AND part:", part)
-    else:
-        pass
@@ -0,0 +1,245 @@
+"""Chunked, resumable upload of large dataset files to openBIS, with throughput reporting.
+
+The file is sent in chunks of bounded size to the session workspace of the datastore server, the same endpoint
+pybis uses, and then registered as a dataset. The last acknowledged chunk is recorded next to the file, so an
+interrupted upload continues from there instead of starting over.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+import urllib.parse
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin
+
+from . import instrumentation
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    import pybis
+
+SESSION_WORKSPACE_UPLOAD = "/datastore_server/session_workspace_file_upload"
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MiB
+
+
+@dataclass
+class UploadProgress:
+    """Progress of a chunked upload, passed to the progress callback after every chunk."""
+
+    filename: str
+    bytes_sent: int
+    total_bytes: int
+    bytes_per_second: float
+    eta_seconds: float | None
+
+    @property
+    def fraction(self) -> float:
+        """The uploaded fraction of the file, between 0 and 1."""
+        return self.bytes_sent / self.total_bytes if self.total_bytes else 1.0
+
+
+def _state_path(path: Path) -> Path:
+    return path.with_name(f".{path.name}.upload")
+
+
+def _token_hash(token: str) -> str:
+    """Hash the session token, so that the state file next to the upload does not give the session away."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _load_state(path: Path, token: str) -> dict | None:
+    """Get the saved state of an interrupted upload of `path`, if it is still usable."""
+    state_path = _state_path(path)
+    if not state_path.exists():
+        return None
+    with state_path.open() as f:
+        state = json.load(f)
+    stat = path.stat()
+    # The session workspace belongs to the session, and a changed file has to be sent again from the start.
+    if (
+        state.get("token_sha256") != _token_hash(token)
+        or state.get("size") != stat.st_size
+        or state.get("mtime_ns") != stat.st_mtime_ns
+    ):
+        return None
+    return state
+
+
+def _save_state(path: Path, state: dict) -> None:
+    state_path = _state_path(path)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with tmp_path.open("w") as f:
+        json.dump(state, f)
+    tmp_path.replace(state_path)
+
+
+def upload_file_chunked(
+        ob: pybis.Openbis,
+        path: str | Path,
+        datastore_url: str | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress_callback: Callable[[UploadProgress], None] | None = None,
+        max_retries: int = 3,
+) -> str:
+    """Upload a file to the session workspace of the datastore server in chunks.
+
+    At most one chunk is held in memory. After each acknowledged chunk the offset is saved to a hidden
+    `.<filename>.upload` file next to the upload, so that calling this function again after an interruption resumes
+    from the last acknowledged chunk. Failed chunks are retried up to `max_retries` times.
+
+    Args:
+        ob (pybis.Openbis): An authenticated openBIS session.
+        path (str | Path): The file to upload.
+        datastore_url (str, optional): The download URL of the datastore server. Defaults to the first datastore.
+        chunk_size (int, optional): The size of each chunk in bytes. Defaults to 16 MiB.
+        progress_callback (Callable[[UploadProgress], None], optional): Called after every chunk with the bytes
+            sent, the throughput and the estimated remaining time.
+        max_retries (int, optional): How often a failed chunk is retried before giving up. Defaults to 3.
+
+    Returns:
+        str: The upload id under which the file is stored in the session workspace.
+
+    """
+    import requests
+
+    path = Path(path)
+    if datastore_url is None:
+        instrumentation.record(openbis_calls=1)
+        datastore_url = ob.get_datastores()["downloadUrl"][0]
+    # Reuse the connection pool of a stand-in like `fake_openbis.FakeOpenbis` if there is one.
+    http = getattr(ob, "_http", None) or requests.Session()
+
+    total_bytes = path.stat().st_size
+    state = _load_state(path, ob.token)
+    if state is None:
+        stat = path.stat()
+        state = {
+            "upload_id": str(uuid.uuid4()),
+            "offset": 0,
+            "chunk": 1,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "token_sha256": _token_hash(ob.token),
+        }
+    url_filename = f"{state['upload_id']}/{urllib.parse.quote(path.name)}"
+
+    start_time = time.perf_counter()
+    start_offset = state["offset"]
+    with path.open("rb") as f:
+        f.seek(state["offset"])
+        while state["offset"] < total_bytes:
+            chunk = f.read(chunk_size)
+            start_byte = state["offset"]
+            end_byte = min(start_byte + chunk_size - 1, total_bytes)
+            params = {
+                "filename": url_filename,
+                "id": state["chunk"],
+                "startByte": start_byte,
+                "endByte": end_byte,
+                "emptyFolder": False,
+                "sessionID": ob.token,
+            }
+            for attempt in range(max_retries + 1):
+                try:
+                    resp = http.post(
+                        datastore_url + SESSION_WORKSPACE_UPLOAD,
+                        params=params,
+                        data=chunk,
+                        verify=ob.verify_certificates,
+                    )
+                    resp.raise_for_status()
+                    instrumentation.record(openbis_calls=1, bytes_uploaded=len(chunk))
+                    break
+                except requests.RequestException:
+                    instrumentation.record(openbis_calls=1, errors=1)
+                    if attempt == max_retries:
+                        raise
+                    time.sleep(2**attempt)
+
+            state["offset"] += len(chunk)
+            state["chunk"] += 1
+            _save_state(path, state)
+
+            if progress_callback is not None:
+                elapsed = time.perf_counter() - start_time
+                bytes_per_second = (state["offset"] - start_offset) / elapsed if elapsed > 0 else 0.0
+                remaining = total_bytes - state["offset"]
+                progress_callback(UploadProgress(
+                    filename=path.name,
+                    bytes_sent=state["offset"],
+                    total_bytes=total_bytes,
+                    bytes_per_second=bytes_per_second,
+                    eta_seconds=remaining / bytes_per_second if bytes_per_second > 0 else None,
+                ))
+
+    return state["upload_id"]
+
+
+def upload_dataset_chunked(
+        ob: pybis.Openbis,
+        path: str | Path,
+        dataset_type: str,
+        experiment_identifier: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress_callback: Callable[[UploadProgress], None] | None = None,
+) -> str:
+    """Upload a file in chunks and register it as a dataset of an experiment.
+
+    Args:
+        ob (pybis.Openbis): An authenticated openBIS session.
+        path (str | Path): The file to upload.
+        dataset_type (str): The openBIS dataset type.
+        experiment_identifier (str): The identifier of the experiment the dataset belongs to.
+        chunk_size (int, optional): The size of each chunk in bytes. Defaults to 16 MiB.
+        progress_callback (Callable[[UploadProgress], None], optional): Called after every chunk, see
+            `upload_file_chunked`.
+
+    Returns:
+        str: The permId of the new dataset.
+
+    Raises:
+        ValueError: If openBIS does not return a permId for the new dataset.
+
+    """
+    path = Path(path)
+    instrumentation.record(openbis_calls=1)
+    datastore_url = ob.get_datastores()["downloadUrl"][0]
+    upload_id = upload_file_chunked(
+        ob, path, datastore_url=datastore_url, chunk_size=chunk_size, progress_callback=progress_callback,
+    )
+
+    # Register the uploaded file as a dataset, as pybis does after its own session workspace upload.
+    creation = {
+        "@type": "dss.dto.dataset.create.UploadedDataSetCreation",
+        "@id": "1",
+        "typeId": {
+            "@type": "as.dto.entitytype.id.EntityTypePermId",
+            "@id": "2",
+            "permId": dataset_type.upper(),
+            "entityKind": "DATA_SET",
+        },
+        "experimentId": {
+            "@type": "as.dto.experiment.id.ExperimentIdentifier",
+            "@id": "3",
+            "identifier": experiment_identifier.upper(),
+        },
+        "properties": {},
+        "parentIds": [],
+        "uploadId": upload_id,
+    }
+    request = {"method": "createUploadedDataSet", "params": [ob.token, creation]}
+    instrumentation.record(openbis_calls=1)
+    resp = ob._post_request_full_url(urljoin(datastore_url, ob.dss_v3), request)
+    perm_id = resp.get("permId") if isinstance(resp, dict) else None
+    if not perm_id:
+        msg = f"Error while registering the uploaded dataset {path.name}: {resp}"
+        raise ValueError(msg)
+
+    _state_path(path).unlink(missing_ok=True)
+    return perm_id
@@ -1,13 +1,35 @@
-"""Main module for this repository."""
+"""Main module for this repository.
 
+pybis and openpyxl are only imported when an openBIS session or an Excel file is actually needed, so that importing
+this module, e.g. for `Identifiers`, stays fast.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import hashlib
 import json
+import os
 import shutil
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cache, partial
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import analyzed_json, instrumentation, oh_my_ontology, pathfolio, streaming
+from .instrumentation import PushMetrics
+from .manifest import UploadManifest
 
-import pybis
-from openpyxl import load_workbook
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
 
-from . import keller, oh_my_ontology, pathfolio
+    import pybis
+
+    from .streaming import UploadProgress
 
 
 class Identifiers:
@@ -46,9 +68,256 @@ class Dataset:
         self.data = upload_data
         self.experiment = self.ident.experiment_identifier.upper()  # Use the provided Identifiers instance
 
-    def upload_dataset(self) -> None:
-        """Upload the dataset to the openBIS."""
-        self.ob.new_dataset(type=self.type, experiment=self.experiment, file=self.data).save()
+    def upload_dataset(self) -> str:
+        """Upload the dataset to the openBIS and return its permId."""
+        dataset = self.ob.new_dataset(type=self.type, experiment=self.experiment, file=self.data)
+        dataset.save()
+        # pybis uploads the file to the session workspace and then registers the dataset.
+        instrumentation.record(openbis_calls=2, bytes_uploaded=Path(self.data).stat().st_size)
+        return dataset.permId
+
+    async def upload_dataset_async(self, executor: Executor | None = None) -> str:
+        """Upload the dataset without blocking the event loop, running the pybis upload in `executor`."""
+        return await _run_in(executor, self.upload_dataset)
+
+    def upload_dataset_streaming(
+            self,
+            chunk_size: int = streaming.DEFAULT_CHUNK_SIZE,
+            progress_callback: Callable[[UploadProgress], None] | None = None,
+        ) -> str:
+        """Upload the dataset file in chunks with bounded memory and return its permId.
+
+        Throughput and ETA are reported through `progress_callback`, and an interrupted upload resumes from the last
+        acknowledged chunk when called again. See `streaming.upload_dataset_chunked`.
+        """
+        return streaming.upload_dataset_chunked(
+            self.ob,
+            self.data,
+            dataset_type=self.type,
+            experiment_identifier=self.experiment,
+            chunk_size=chunk_size,
+            progress_callback=progress_callback,
+        )
+
+
+@dataclass
+class PropertyUploadResult:
+    """Outcome of writing the mapped metadata properties to an openBIS experiment."""
+
+    uploaded: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+    n_saves: int = 0
+    saved: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+
+@dataclass
+class PushResult:
+    """Summary of a single experiment push."""
+
+    experiment_identifier: str
+    properties: PropertyUploadResult = field(default_factory=PropertyUploadResult)
+    datasets: dict[str, str] = field(default_factory=dict)
+    skipped: list[str] = field(default_factory=list)
+    metrics: PushMetrics = field(default_factory=PushMetrics)
+    replaced: list[str] = field(default_factory=list)
+
+
+@dataclass
+class FolderPushReport:
+    """Result, timing and metrics of pushing one experiment folder as part of a batch."""
+
+    folder: str
+    duration: float
+    result: PushResult | None = None
+    error: str | None = None
+    metrics: PushMetrics | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Whether the push succeeded, which it did not if it raised or every metadata property was rejected."""
+        return self.failure is None
+
+    @property
+    def failure(self) -> str | None:
+        """The reason the push did not succeed, or None if it did."""
+        if self.error is not None:
+            return self.error
+        properties = self.result.properties if self.result is not None else None
+        if properties is not None and properties.failed and not properties.uploaded:
+            first = next(iter(properties.failed.values()))
+            return f"All {len(properties.failed)} metadata properties were rejected, e.g. {first}"
+        return None
+
+
+def upload_properties(
+        exp: pybis.experiment.Experiment,
+        sample_metadata: dict,
+        dict_mapping: dict = pathfolio.dict_json_to_openbis,
+        batch: bool = True,
+) -> PropertyUploadResult:
+    """Write the mapped metadata from the analyzed json file to the properties of an openBIS experiment.
+
+    In batch mode all properties are set locally and persisted with a single save. If that save is rejected by the
+    server, the properties are written again one by one so that the offending fields can be identified.
+
+    Args:
+        exp (pybis.experiment.Experiment): The (new or existing) openBIS experiment.
+        sample_metadata (dict): The "sample_data" section of the analyzed json file.
+        dict_mapping (dict, optional): A dictionary mapping JSON keys to openBIS codes.
+            Defaults to `pathfolio.dict_json_to_openbis`.
+        batch (bool, optional): Persist all properties in one save instead of one save per property.
+            Defaults to True.
+
+    Returns:
+        PropertyUploadResult: The openBIS codes that were written, the codes that failed together with their error
+            message, the number of saves sent to the server and whether any of them succeeded.
+
+    """
+    result = PropertyUploadResult()
+    if not batch:
+        return _upload_properties_one_by_one(exp, sample_metadata, dict_mapping, result)
+
+    for json_key, openbis_code in dict_mapping.items():
+        try:
+            exp.p[openbis_code] = sample_metadata.get(json_key)
+        except Exception as e:
+            result.failed[openbis_code] = f"{json_key}: {e}"
+            continue
+        result.uploaded.append(openbis_code)
+    # Count the values rejected locally now, the fallback only counts the failures of its own saves.
+    instrumentation.record(errors=len(result.failed))
+
+    try:
+        result.n_saves += 1
+        instrumentation.record(openbis_calls=1)
+        exp.save()
+        result.saved = True
+    except Exception:
+        # Clear what was set and fall back to single saves to find out which fields the server rejects.
+        accepted = {k: v for k, v in dict_mapping.items() if v in result.uploaded}
+        for openbis_code in result.uploaded:
+            exp.p[openbis_code] = None
+        result.uploaded = []
+        return _upload_properties_one_by_one(exp, sample_metadata, accepted, result)
+    return result
+
+
+def _upload_properties_one_by_one(
+        exp: pybis.experiment.Experiment,
+        sample_metadata: dict,
+        dict_mapping: dict,
+        result: PropertyUploadResult,
+) -> PropertyUploadResult:
+    """Set and save the experiment properties one at a time, recording every failure in `result`."""
+    for json_key, openbis_code in dict_mapping.items():
+        try:
+            exp.p[openbis_code] = sample_metadata.get(json_key)
+            result.n_saves += 1
+            instrumentation.record(openbis_calls=1)
+            exp.save()
+            result.saved = True
+        except Exception as e:
+            result.failed[openbis_code] = f"{json_key}: {e}"
+            instrumentation.record(errors=1)
+            # Do not let a rejected value poison the following saves.
+            with contextlib.suppress(Exception):
+                exp.p[openbis_code] = None
+            continue
+        result.uploaded.append(openbis_code)
+    return result
+
+
+def _same_property_value(current: str | None, new: object) -> bool:
+    """Check if a property value read from openBIS, where every value is a string, equals a value to be written."""
+    if new is None or new == "":
+        return current is None or current == ""
+    if current is None:
+        return False
+    if isinstance(new, bool):
+        return current.lower() == str(new).lower()
+    if isinstance(new, int | float):
+        try:
+            return float(current) == float(new)
+        except ValueError:
+            return False
+    return current == str(new)
+
+
+def diff_properties(current: dict[str, str], sample_metadata: dict, dict_mapping: dict) -> dict:
+    """Get the mapped metadata properties whose value differs from the current properties of an experiment.
+
+    Args:
+        current (dict[str, str]): The current property values of the experiment, by upper-case openBIS code.
+        sample_metadata (dict): The "sample_data" section of the analyzed json file.
+        dict_mapping (dict): A dictionary mapping JSON keys to openBIS codes.
+
+    Returns:
+        dict: The new values of the changed properties, by openBIS code.
+
+    """
+    changed = {}
+    for json_key, openbis_code in dict_mapping.items():
+        value = sample_metadata.get(json_key)
+        if not _same_property_value(current.get(openbis_code.upper()), value):
+            changed[openbis_code] = value
+    return changed
+
+
+def update_properties(
+        ob: pybis.Openbis,
+        experiment_identifier: str,
+        current: dict[str, str],
+        sample_metadata: dict,
+        dict_mapping: dict = pathfolio.dict_json_to_openbis,
+) -> PropertyUploadResult:
+    """Write only the changed metadata properties of an existing openBIS experiment.
+
+    The changed properties are written in a single update. If the server rejects it, they are written again one by
+    one so that the offending fields can be identified.
+
+    Args:
+        ob (pybis.Openbis): The openBIS session.
+        experiment_identifier (str): The identifier of the experiment.
+        current (dict[str, str]): The current property values of the experiment, by upper-case openBIS code.
+        sample_metadata (dict): The "sample_data" section of the analyzed json file.
+        dict_mapping (dict, optional): A dictionary mapping JSON keys to openBIS codes.
+            Defaults to `pathfolio.dict_json_to_openbis`.
+
+    Returns:
+        PropertyUploadResult: The openBIS codes that were changed, the codes that failed together with their error
+            message, the number of updates sent to the server and whether any of them succeeded.
+
+    """
+    from . import keller
+
+    result = PropertyUploadResult()
+    changed = diff_properties(current, sample_metadata, dict_mapping)
+    if not changed:
+        return result
+    try:
+        result.n_saves += 1
+        instrumentation.record(openbis_calls=1)
+        keller.update_experiment_properties(ob, experiment_identifier, changed)
+    except Exception:
+        for openbis_code, value in changed.items():
+            try:
+                result.n_saves += 1
+                instrumentation.record(openbis_calls=1)
+                keller.update_experiment_properties(ob, experiment_identifier, {openbis_code: value})
+            except Exception as e:
+                result.failed[openbis_code] = str(e)
+                instrumentation.record(errors=1)
+                continue
+            result.uploaded.append(openbis_code)
+            result.saved = True
+        return result
+    result.uploaded = list(changed)
+    result.saved = True
+    return result
 
 
 def push_exp(
@@ -59,7 +328,16 @@ def push_exp(
         space_code: str = "TEST_SPACE_PYBIS",
         project_code: str = "TEST_UPLOAD",
         experiment_type: str = "Battery_Premise3",
-) -> None:
+        batch_properties: bool = True,
+        openbis_obj: pybis.Openbis | None = None,
+        pipelined: bool = False,
+        resume: bool = True,
+        in_memory_metadata: bool = True,
+        stream_threshold: int | None = None,
+        progress_callback: Callable[[UploadProgress], None] | None = None,
+        dir_template: str = oh_my_ontology.DEFAULT_TEMPLATE,
+        metrics: PushMetrics | None = None,
+) -> PushResult:
     """Pushes experimental data and metadata from a local folder to an openBIS instance.
 
     Args:
@@ -74,135 +352,920 @@ def push_exp(
             Defaults to 'TEST_UPLOAD'.
         experiment_type (str, optional): The type of experiment to be created in openBIS. Defaults
             to 'Battery_Premise3'.
+        batch_properties (bool, optional): Write all metadata properties with a single save instead of
+            one save per property. Defaults to True.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session to reuse. If not given, a new one
+            is created from `dir_pat`.
+        pipelined (bool, optional): Upload the datasets concurrently. The raw HDF5 upload starts right away and
+            runs while the metadata Excel and JSON-LD files are generated locally. Defaults to False.
+        resume (bool, optional): Keep an upload manifest in the folder and skip the stages that a previous push
+            already finished for unchanged files. Defaults to True.
+        in_memory_metadata (bool, optional): Merge the metadata and build the JSON-LD in memory, writing the merged
+            metadata Excel file only as an output. If False, the intermediate Excel files are written and read
+            back as before. Defaults to True.
+        stream_threshold (int, optional): Files of at least this many bytes, typically the raw HDF5 file, are
+            uploaded in resumable chunks with `Dataset.upload_dataset_streaming`. Defaults to None, uploading
+            every file through pybis.
+        progress_callback (Callable[[UploadProgress], None], optional): Called with the throughput and ETA of the
+            streamed uploads.
+        dir_template (str, optional): The BattINFO template Excel file the metadata files are generated from.
+            Defaults to `oh_my_ontology.DEFAULT_TEMPLATE`.
+        metrics (PushMetrics, optional): Collect the stage timings, openBIS calls, uploaded bytes and errors into
+            this object, which is also filled if the push fails. Defaults to a new one, returned in the result.
 
     Raises:
         ValueError: If there is not exactly one JSON file in the specified folder.
         ValueError: If the JSON file name does not follow the required naming convention.
         ValueError: If there is not exactly one raw HDF5 file in the specified folder.
+        ValueError: If the manifest records a dataset that was uploaded from files that changed since, use
+            `update_exp` to replace it.
+        ValueError: If the experiment is not recorded in the manifest and could not be created, e.g. because it
+            exists already. Use `update_exp` for experiments pushed without a manifest.
 
     Returns:
-        None
+        PushResult: The experiment identifier, the outcome of the metadata property upload, the permIds of the
+            datasets, the stages skipped because a previous push finished them and the metrics of the push.
 
     """
-    dir_folder = Path(dir_folder)
-    ob = keller.get_openbis_obj(dir_pat)
+    from . import keller
 
-    list_json = [
-        file for file in dir_folder.iterdir()
-        if file.suffix == ".json" and not file.stem.startswith("ontologized")
-    ]
-    if len(list_json) != 1:
+    metrics = metrics if metrics is not None else PushMetrics()
+    with instrumentation.collect(metrics):
+        ob = openbis_obj if openbis_obj is not None else keller.get_openbis_obj(dir_pat)
+        dir_json, dir_raw, dir_custom = _find_push_files(Path(dir_folder))
+        exp_name = dir_json.stem.split(".")[1]  # Extract the experiment name from the json file name
+        ident = Identifiers(space_code, project_code, experiment_code=exp_name)
+
+        manifest = UploadManifest.load(dir_folder) if resume else None
+        result = PushResult(experiment_identifier=ident.experiment_identifier.upper(), metrics=metrics)
+        metrics.experiment_identifier = result.experiment_identifier
+        # Read the sample data once, when the first stage needs it, and share it with the later stages.
+        get_sample_metadata = cache(partial(analyzed_json.read_sample_data, dir_json))
+        _push_properties(
+            ob, dir_json, get_sample_metadata, ident, manifest, result, dict_mapping, experiment_type,
+            batch_properties,
+        )
+
+        # Upload the datasets, generating the metadata Excel and JSON-LD files on the way.
+        uploader = _DatasetUploader(
+            ob, ident, manifest, result, get_sample_metadata, stream_threshold, progress_callback,
+        )
+        upload_kwargs = {
+            "uploader": uploader,
+            "dir_json": dir_json,
+            "get_sample_metadata": get_sample_metadata,
+            "dir_raw": dir_raw,
+            "dir_custom": dir_custom,
+            "user_mapping": user_mapping,
+            "in_memory_metadata": in_memory_metadata,
+            "dir_template": dir_template,
+        }
+        if pipelined:
+            _upload_datasets_pipelined(**upload_kwargs)
+        else:
+            _upload_datasets_sequential(**upload_kwargs)
+
+        return result
+
+@dataclass
+class ExperimentFiles:
+    """The input files of an experiment folder, found with a single directory scan."""
+
+    json_files: list[Path] = field(default_factory=list)
+    raw_files: list[Path] = field(default_factory=list)
+    custom_files: list[Path] = field(default_factory=list)
+
+    @classmethod
+    def scan(cls, dir_folder: str | Path) -> ExperimentFiles:
+        """List the analyzed json, raw HDF5 and custom metadata files of a folder."""
+        files = cls()
+        with os.scandir(dir_folder) as entries:
+            for entry in entries:
+                file = Path(entry.path)
+                if file.suffix == ".json" and not file.stem.startswith("ontologized"):
+                    files.json_files.append(file)
+                elif file.suffix == ".h5" and file.name.startswith("full."):
+                    files.raw_files.append(file)
+                elif file.name.endswith("custom_metadata.xlsx"):
+                    files.custom_files.append(file)
+        return files
+
+    @property
+    def custom(self) -> Path | None:
+        """The custom metadata Excel file, if there is one."""
+        return self.custom_files[0] if self.custom_files else None
+
+
+def _find_push_files(dir_folder: Path) -> tuple[Path, Path, Path | None]:
+    """Get the analyzed json file, the raw HDF5 file and the custom metadata file, if any, of an experiment folder.
+
+    Raises:
+        ValueError: If there is not exactly one JSON file in the folder.
+        ValueError: If the JSON file name does not follow the required naming convention.
+        ValueError: If there is not exactly one raw HDF5 file in the folder.
+
+    """
+    files = ExperimentFiles.scan(dir_folder)
+    if len(files.json_files) != 1:
         msg = "There should be exactly one json file in the folder"
         raise ValueError(msg)
 
-    name_json = list_json[0].name
-    dir_json = dir_folder / name_json
+    dir_json = files.json_files[0]
 
     if len(dir_json.name.split(".")) != 3:
         msg = "Not recognized json file name. The recognized file name is cycle.experiment_code.json"
         raise ValueError(msg)
 
-    exp_name = dir_json.stem.split(".")[1]  # Extract the experiment name from the json file name
-    ident = Identifiers(space_code, project_code, experiment_code=exp_name)
+    # Check the raw data file before creating anything in openBIS.
+    if len(files.raw_files) != 1:
+        msg = "There should be exactly one raw_h5 file in the folder"
+        raise ValueError(msg)
+    return dir_json, files.raw_files[0], files.custom
+
 
-    # Create new experiment in the predefined space and project.
-    exp = ob.new_experiment(code=ident.experiment_code, type=experiment_type, project=ident.project_identifier)
+def _push_properties(
+        ob: pybis.Openbis,
+        dir_json: Path,
+        get_sample_metadata: Callable[[], dict],
+        ident: Identifiers,
+        manifest: UploadManifest | None,
+        result: PushResult,
+        dict_mapping: dict,
+        experiment_type: str,
+        batch_properties: bool,
+) -> None:
+    """Create or fetch the experiment and write its properties, unless the manifest records them as done."""
+    experiment_exists = (
+        manifest is not None
+        and manifest.is_done("experiment")
+        and manifest.experiment_identifier == result.experiment_identifier
+    )
+    if experiment_exists:
+        result.skipped.append("experiment")
 
     # Iterate through list of metadata from json file and upload them to the experiment.
-    with Path(dir_json).open() as f:
-        sample_metadata = json.load(f)["metadata"]["sample_data"]
+    json_inputs = {"json": manifest.fingerprint(dir_json)} if manifest is not None else None
+    if manifest is not None and manifest.is_done("properties", json_inputs):
+        result.skipped.append("properties")
+        return
 
-    for json_key, openbis_code in dict_mapping.items():
-        try:
-            print(f"Uploading metadata for {openbis_code} from {json_key}")
-            exp.p[openbis_code] = sample_metadata.get(json_key)
-            exp.save()
-        except Exception as e:
-            print(f"Error uploading metadata for {openbis_code} from {json_key}")
-            print(f"The error message is: {e} \n")
-            continue
+    with instrumentation.stage("properties"):
+        # Create new experiment in the predefined space and project, or continue with the one of an earlier push.
+        if experiment_exists:
+            instrumentation.record(openbis_calls=1)
+            exp = ob.get_experiment(result.experiment_identifier)
+        else:
+            exp = ob.new_experiment(
+                code=ident.experiment_code, type=experiment_type, project=ident.project_identifier,
+            )
+        with instrumentation.stage("read_json"):
+            sample_metadata = get_sample_metadata()
+        result.properties = upload_properties(exp, sample_metadata, dict_mapping=dict_mapping, batch=batch_properties)
+    if not experiment_exists and not result.properties.saved:
+        # Nothing was saved, so the experiment was not created and the datasets would have nowhere to go.
+        reason = next(iter(result.properties.failed.values()), "no property was saved")
+        msg = (
+            f"Could not create the experiment {result.experiment_identifier} ({reason}), "
+            "use update_exp if it exists already"
+        )
+        raise ValueError(msg)
+    if manifest is not None and result.properties.saved:
+        manifest.experiment_identifier = result.experiment_identifier
+        manifest.mark_done("experiment")
+        if result.properties.ok:
+            manifest.mark_done("properties", json_inputs)
 
-    # Upload the dataset
 
-    # Analyzed data
-    ds_analyzed_json = Dataset(ob, ident=ident)
-    ds_analyzed_json.type = "premise_cucumber_analyzed_battery_data"
-    ds_analyzed_json.data = dir_json
-    ds_analyzed_json.upload_dataset()
+def update_exp(
+        dir_pat: str,
+        dir_folder: str,
+        user_mapping: dict | None = None,
+        dict_mapping: dict = pathfolio.dict_json_to_openbis,
+        space_code: str = "TEST_SPACE_PYBIS",
+        project_code: str = "TEST_UPLOAD",
+        openbis_obj: pybis.Openbis | None = None,
+        pipelined: bool = False,
+        in_memory_metadata: bool = True,
+        stream_threshold: int | None = None,
+        progress_callback: Callable[[UploadProgress], None] | None = None,
+        dir_template: str = oh_my_ontology.DEFAULT_TEMPLATE,
+        metrics: PushMetrics | None = None,
+) -> PushResult:
+    """Bring an experiment pushed earlier up to date with its folder, e.g. after the analyzed json was regenerated.
+
+    The current properties and datasets of the experiment are fetched in one call. Only the properties that differ
+    from the sample data are written, in one update, and only the datasets whose inputs changed since they were
+    uploaded, according to the upload manifest of the folder, are uploaded again. The metadata Excel and JSON-LD files
+    only count as changed if the sample data or the custom metadata did. The datasets that were replaced are moved to
+    the openBIS trash at the end. A dataset the manifest does not know about, e.g. because the experiment was pushed
+    from another machine, is replaced.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        dir_folder (str): Path to the directory containing the experimental data files.
+        user_mapping (dict, optional): A dictionary mapping short name codes to full names.
+        dict_mapping (dict, optional): A dictionary mapping JSON keys to openBIS codes
+            for metadata extraction. Defaults to `pathfolio.dict_json_to_openbis`.
+        space_code (str, optional): The openBIS space code of the experiment. Defaults to 'TEST_SPACE_PYBIS'.
+        project_code (str, optional): The openBIS project code of the experiment. Defaults to 'TEST_UPLOAD'.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session to reuse. If not given, a new one
+            is created from `dir_pat`.
+        pipelined (bool, optional): Upload the datasets concurrently, as in `push_exp`. Defaults to False.
+        in_memory_metadata (bool, optional): Generate the metadata files in memory, as in `push_exp`.
+            Defaults to True.
+        stream_threshold (int, optional): Files of at least this many bytes are uploaded in resumable chunks, as in
+            `push_exp`. Defaults to None.
+        progress_callback (Callable[[UploadProgress], None], optional): Called with the throughput and ETA of the
+            streamed uploads.
+        dir_template (str, optional): The BattINFO template Excel file the metadata files are generated from.
+            Defaults to `oh_my_ontology.DEFAULT_TEMPLATE`.
+        metrics (PushMetrics, optional): Collect the stage timings, openBIS calls, uploaded bytes and errors into
+            this object. Defaults to a new one, returned in the result.
+
+    Returns:
+        PushResult: The changed properties, the permIds of the current datasets, the datasets that were up to date
+            in `skipped` and the permIds of the deleted datasets in `replaced`.
+
+    Raises:
+        ValueError: If the folder does not contain exactly one JSON file and one raw HDF5 file.
+        ValueError: If the experiment does not exist in openBIS.
+
+    """
+    from . import keller
+
+    metrics = metrics if metrics is not None else PushMetrics()
+    with instrumentation.collect(metrics):
+        ob = openbis_obj if openbis_obj is not None else keller.get_openbis_obj(dir_pat)
+        dir_json, dir_raw, dir_custom = _find_push_files(Path(dir_folder))
+        exp_name = dir_json.stem.split(".")[1]
+        ident = Identifiers(space_code, project_code, experiment_code=exp_name)
+
+        manifest = UploadManifest.load(dir_folder)
+        result = PushResult(experiment_identifier=ident.experiment_identifier.upper(), metrics=metrics)
+        metrics.experiment_identifier = result.experiment_identifier
+        with instrumentation.stage("fetch_experiment"):
+            instrumentation.record(openbis_calls=1)
+            state = keller.get_experiment_state(ob, result.experiment_identifier)
+        if state is None:
+            msg = f"Experiment {result.experiment_identifier} does not exist, push it with push_exp first"
+            raise ValueError(msg)
+
+        get_sample_metadata = cache(partial(analyzed_json.read_sample_data, dir_json))
+        with instrumentation.stage("properties"):
+            with instrumentation.stage("read_json"):
+                sample_metadata = get_sample_metadata()
+            result.properties = update_properties(
+                ob, result.experiment_identifier, state.properties, sample_metadata, dict_mapping=dict_mapping,
+            )
+        if not result.properties.uploaded and result.properties.ok:
+            result.skipped.append("properties")
+        if result.properties.ok:
+            manifest.experiment_identifier = result.experiment_identifier
+            manifest.mark_done("experiment")
+            manifest.mark_done("properties", {"json": manifest.fingerprint(dir_json)})
+
+        uploader = _DatasetUploader(
+            ob, ident, manifest, result, get_sample_metadata, stream_threshold, progress_callback,
+            existing=state.datasets,
+        )
+        upload_kwargs = {
+            "uploader": uploader,
+            "dir_json": dir_json,
+            "get_sample_metadata": get_sample_metadata,
+            "dir_raw": dir_raw,
+            "dir_custom": dir_custom,
+            "user_mapping": user_mapping,
+            "in_memory_metadata": in_memory_metadata,
+            "dir_template": dir_template,
+        }
+        if pipelined:
+            _upload_datasets_pipelined(**upload_kwargs)
+        else:
+            _upload_datasets_sequential(**upload_kwargs)
+
+        # Delete the replaced datasets only now, so that a failed upload leaves the previous version in place.
+        if uploader.replaced:
+            with instrumentation.stage("delete_replaced"):
+                instrumentation.record(openbis_calls=1)
+                keller.delete_datasets(ob, uploader.replaced, reason=f"Replaced by an update from {dir_json.name}")
+            result.replaced = uploader.replaced
+        return result
 
-    # Raw data
-    list_raw_data = [
-        file for file in dir_folder.iterdir()
-        if file.suffix == ".h5" and file.name.startswith("full.")
-    ]
-    if len(list_raw_data) != 1:
-        msg = "There should be exactly one raw_h5 file in the folder"
-        raise ValueError(msg)
 
-    dir_raw_json = list_raw_data[0]
-    ds_raw_data = Dataset(ob, ident=ident)
-    ds_raw_data.type = "premise_cucumber_raw_battery_data"
-    ds_raw_data.data = dir_raw_json
-    ds_raw_data.upload_dataset()
+def merge_metadata_xlsx(
+        dir_json: Path,
+        user_mapping: dict | None = None,
+        dir_template: str = oh_my_ontology.DEFAULT_TEMPLATE,
+        sample_metadata: dict | None = None,
+        dir_custom: Path | None = None,
+) -> Path:
+    """Generate the merged metadata Excel file of an experiment.
+
+    The automatically extracted metadata is written to `<exp>_automated_extract_metadata.xlsx`, copied to
+    `<exp>_merged_metadata.xlsx` and, if a `*custom_metadata.xlsx` file is given, its values are merged in.
+
+    Args:
+        dir_json (Path): Path to the analyzed json file, named cycle.experiment_code.json.
+        user_mapping (dict, optional): A dictionary mapping short name codes to full names.
+        dir_template (str, optional): The template Excel file. Defaults to `oh_my_ontology.DEFAULT_TEMPLATE`.
+        sample_metadata (dict, optional): The "sample_data" section of the analyzed json file, if it was already
+            read.
+        dir_custom (Path, optional): The custom metadata Excel file of the experiment, as found by
+            `ExperimentFiles.scan`. Defaults to None, merging no custom metadata.
+
+    Returns:
+        Path: The path to the merged metadata Excel file.
+
+    """
+    dir_folder = dir_json.parent
+    exp_name = dir_json.stem.split(".")[1]
 
     # Create the automated_extract_metadata.xlsx file
-    oh_my_ontology.gen_metadata_xlsx(dir_json, user_mapping=user_mapping)
+    oh_my_ontology.gen_metadata_xlsx(
+        dir_json, user_mapping=user_mapping, dir_template=dir_template, sample_metadata=sample_metadata,
+    )
     source_file = dir_folder / f"{exp_name}_automated_extract_metadata.xlsx"
     dest_file = dir_folder / f"{exp_name}_merged_metadata.xlsx"
     print(f"Copying {source_file} to {dest_file}")
     shutil.copy(source_file, dest_file)
 
-    # Check if there is already a custom Excel file for the experiment. If so, create JSON-LD from it.
-    custom_metadata_files = [file for file in dir_folder.iterdir() if file.name.endswith("custom_metadata.xlsx")]
-    if custom_metadata_files:
-        custom_metadata = custom_metadata_files[0]
+    # Merge the custom Excel file of the experiment, if there is one.
+    if dir_custom is not None:
+        merge_custom_metadata(dest_file, dir_custom)
+    return dest_file
 
-        # Load both Excel files
-        merged_wb = load_workbook(dest_file)
-        custom_wb = load_workbook(custom_metadata)
 
-        # Select the "Schema" sheet from both workbooks
-        merged_sheet = merged_wb["Schema"]
-        custom_sheet = custom_wb["Schema"]
+def merge_custom_metadata(dest_file: Path, custom_metadata: Path) -> None:
+    """Write the non-empty values of a custom metadata Excel file into the merged metadata Excel file.
 
-        # Find the "Value" column index in the "Schema" sheet
-        header_row = 1  # Assuming headers are in the first row
-        value_column_index = None
+    Values are matched by their Metadata name, so the rows of the custom file may be in any order and need not
+    follow the template.
 
-        for col in range(1, custom_sheet.max_column + 1):
-            if custom_sheet.cell(row=header_row, column=col).value == "Value":
-                value_column_index = col
-                break
-
-        if value_column_index is None:
-            msg = "Column 'Value' not found in the 'Schema' sheet."
-            raise ValueError(msg)
+    Args:
+        dest_file (Path): The merged metadata Excel file, updated in place.
+        custom_metadata (Path): The custom metadata Excel file.
 
-        # Loop through rows in the "Value" column of the custom metadata
-        for row in range(header_row + 1, custom_sheet.max_row + 1):  # Skip the header row
-            custom_value = custom_sheet.cell(row=row, column=value_column_index).value
-            if custom_value:  # Skip if the cell is empty or None
-                # Write the custom value into the corresponding row of the merged metadata
-                merged_sheet.cell(row=row, column=value_column_index).value = custom_value
+    Raises:
+        ValueError: If the "Schema" sheet of the custom file has no "Value" column.
 
-        # Save the updated merged metadata workbook
-        merged_wb.save(dest_file)
+    """
+    custom_values = oh_my_ontology.read_custom_values(custom_metadata)
+    not_found = oh_my_ontology.update_metadata_values(dest_file, custom_values)
+    for key in not_found:
+        print(f"Metadata '{key}' not found in sheet 'Schema'.")
 
-    # Upload the metadata Excel file to the openBIS
-    dir_metadata_excel = dir_folder / f"{exp_name}_merged_metadata.xlsx"
-    ds_metadata_excel = Dataset(ob, ident=ident)
-    ds_metadata_excel.type = "premise_excel_for_ontology"
-    ds_metadata_excel.data = dir_metadata_excel
-    ds_metadata_excel.upload_dataset()
 
-    # Generate the ontologized JSON-LD file
+def _gen_jsonld(dir_xlsx: Path) -> Path:
+    """Generate the ontologized JSON-LD file next to the merged metadata Excel file and return its path."""
+    exp_name = dir_xlsx.name.removesuffix("_merged_metadata.xlsx")
     jsonld_filename = f"ontologized_{exp_name}.json"
-    dir_xlsx = dir_folder / f"{exp_name}_merged_metadata.xlsx"
     oh_my_ontology.gen_jsonld(dir_xlsx, jsonld_filename)
+    return dir_xlsx.parent / jsonld_filename
+
+
+# An input of a dataset: a file of the folder, a precomputed (name, digest) pair, or None for a missing optional file.
+DatasetInput = Path | tuple[str, str] | None
+
+
+class _DatasetUploader:
+    """Upload the datasets of one push, skipping the ones the manifest records as uploaded from the same inputs.
+
+    When updating an existing experiment, `existing` holds the permIds of its datasets by upper-case type. A dataset
+    is then only skipped if the permId recorded in the manifest is still one of them, and all other datasets of each
+    type are collected in `replaced`, to be deleted once the push is done.
+
+    In both modes the metadata Excel and JSON-LD files are considered changed when the sample data or the custom
+    metadata change, not whenever the analyzed json file is regenerated, so a push and an update agree on them.
+    """
+
+    def __init__(
+            self,
+            ob: pybis.Openbis,
+            ident: Identifiers,
+            manifest: UploadManifest | None,
+            result: PushResult,
+            get_sample_metadata: Callable[[], dict],
+            stream_threshold: int | None = None,
+            progress_callback: Callable[[UploadProgress], None] | None = None,
+            existing: dict[str, list[str]] | None = None,
+    ) -> None:
+        self.ob = ob
+        self.ident = ident
+        self.manifest = manifest
+        self.result = result
+        self.stream_threshold = stream_threshold
+        self.progress_callback = progress_callback
+        self.existing = existing
+        self.get_sample_metadata = get_sample_metadata
+        self.replaced: list[str] = []
+
+    def inputs(self, files: list[DatasetInput]) -> dict | None:
+        """Get the content hashes that decide whether a dataset has to be uploaded again."""
+        if self.manifest is None:
+            return None
+        inputs = {}
+        for file in files:
+            if isinstance(file, tuple):
+                inputs[file[0]] = file[1]
+            elif file is not None:
+                inputs[file.name] = self.manifest.fingerprint(file)
+        return inputs
+
+    def metadata_inputs(self, dir_custom: Path | None) -> list[DatasetInput]:
+        """Get the inputs of the metadata Excel and JSON-LD files: the sample data and the custom metadata file."""
+        content = json.dumps(self.get_sample_metadata(), sort_keys=True, default=str).encode()
+        return [("sample_data", hashlib.sha256(content).hexdigest()), dir_custom]
+
+    def is_done(self, dataset_type: str, input_files: list[DatasetInput]) -> bool:
+        stage = f"dataset:{dataset_type}"
+        if self.manifest is None or not self.manifest.is_done(stage, self.inputs(input_files)):
+            return False
+        return self.existing is None or self.manifest.stages[stage]["perm_id"] in self.existing.get(
+            dataset_type.upper(), [],
+        )
+
+    def upload(self, dataset_type: str, path: Path | None, input_files: list[DatasetInput]) -> None:
+        """Upload `path` as a dataset, unless it was already uploaded from the same input files.
+
+        Raises:
+            ValueError: If not updating and the manifest records a dataset of this type uploaded from other files.
+                Uploading another one would leave both in the experiment, `update_exp` replaces it instead.
+
+        """
+        stage = f"dataset:{dataset_type}"
+        if self.is_done(dataset_type, input_files):
+            perm_id = self.result.datasets[dataset_type] = self.manifest.stages[stage]["perm_id"]
+            self.result.skipped.append(stage)
+        else:
+            previous = self.manifest.stages.get(stage, {}).get("perm_id") if self.manifest is not None else None
+            if self.existing is None and previous is not None:
+                msg = (
+                    f"The {dataset_type} dataset of {self.result.experiment_identifier} was already uploaded as "
+                    f"{previous} from other files, use update_exp to replace it"
+                )
+                raise ValueError(msg)
+            inputs = self.inputs(input_files)
+            dataset = Dataset(self.ob, self.ident, dataset_type, path)
+            with instrumentation.stage(f"upload:{dataset_type}"):
+                if self.stream_threshold is not None and path.stat().st_size >= self.stream_threshold:
+                    perm_id = dataset.upload_dataset_streaming(progress_callback=self.progress_callback)
+                else:
+                    perm_id = dataset.upload_dataset()
+            self.result.datasets[dataset_type] = perm_id
+            if self.manifest is not None:
+                self.manifest.mark_done(stage, inputs, perm_id)
+        if self.existing is not None:
+            # Also catches the leftovers of an update that failed before deleting them.
+            self.replaced.extend(p for p in self.existing.get(dataset_type.upper(), []) if p != perm_id)
+
+    def metadata_done(self, input_files: list[DatasetInput]) -> bool:
+        """Check if both the metadata Excel and the JSON-LD file were uploaded from the same inputs.
+
+        If so, they are recorded as skipped and do not need to be generated again.
+        """
+        if not (self.is_done("premise_excel_for_ontology", input_files)
+                and self.is_done("premise_jsonld", input_files)):
+            return False
+        self.upload("premise_excel_for_ontology", None, input_files)
+        self.upload("premise_jsonld", None, input_files)
+        return True
+
+
+def _upload_datasets_sequential(
+        uploader: _DatasetUploader,
+        dir_json: Path,
+        get_sample_metadata: Callable[[], dict],
+        dir_raw: Path,
+        dir_custom: Path | None,
+        user_mapping: dict | None,
+        in_memory_metadata: bool,
+        dir_template: str,
+) -> None:
+    """Generate and upload the datasets of an experiment one after the other."""
+    # Analyzed data
+    uploader.upload("premise_cucumber_analyzed_battery_data", dir_json, [dir_json])
+    # Raw data
+    uploader.upload("premise_cucumber_raw_battery_data", dir_raw, [dir_raw])
+
+    metadata_inputs = uploader.metadata_inputs(dir_custom)
+    if uploader.metadata_done(metadata_inputs):
+        return
+    if in_memory_metadata:
+        with instrumentation.stage("metadata"):
+            dir_xlsx, dir_jsonld = oh_my_ontology.gen_metadata_and_jsonld(
+                dir_json,
+                user_mapping=user_mapping,
+                dir_template=dir_template,
+                dir_custom=dir_custom,
+                sample_metadata=get_sample_metadata(),
+            )
+        uploader.upload("premise_excel_for_ontology", dir_xlsx, metadata_inputs)
+        uploader.upload("premise_jsonld", dir_jsonld, metadata_inputs)
+        return
+    # Metadata Excel file
+    with instrumentation.stage("metadata_xlsx"):
+        dir_xlsx = merge_metadata_xlsx(
+            dir_json, user_mapping=user_mapping, dir_template=dir_template, sample_metadata=get_sample_metadata(),
+            dir_custom=dir_custom,
+        )
+    uploader.upload("premise_excel_for_ontology", dir_xlsx, metadata_inputs)
+    # Ontologized JSON-LD file
+    with instrumentation.stage("jsonld"):
+        dir_jsonld = _gen_jsonld(dir_xlsx)
+    uploader.upload("premise_jsonld", dir_jsonld, metadata_inputs)
+
+
+def _upload_datasets_pipelined(
+        uploader: _DatasetUploader,
+        dir_json: Path,
+        get_sample_metadata: Callable[[], dict],
+        dir_raw: Path,
+        dir_custom: Path | None,
+        user_mapping: dict | None,
+        in_memory_metadata: bool,
+        dir_template: str,
+) -> None:
+    """Upload the datasets of an experiment in the background while the local files are generated.
+
+    The raw data upload is started first as it is usually the largest transfer. All uploads are awaited before
+    returning, and the first upload error, if any, is raised.
+    """
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        # Run each upload in a copy of the current context, so that it is recorded in the metrics of this push.
+        def submit(*args: object) -> Future:
+            return pool.submit(contextvars.copy_context().run, uploader.upload, *args)
+
+        futures = [
+            submit("premise_cucumber_raw_battery_data", dir_raw, [dir_raw]),
+            submit("premise_cucumber_analyzed_battery_data", dir_json, [dir_json]),
+        ]
+        metadata_inputs = uploader.metadata_inputs(dir_custom)
+        metadata_done = uploader.metadata_done(metadata_inputs)
+        if not metadata_done and in_memory_metadata:
+            with instrumentation.stage("metadata"):
+                dir_xlsx, dir_jsonld = oh_my_ontology.gen_metadata_and_jsonld(
+                    dir_json,
+                    user_mapping=user_mapping,
+                    dir_template=dir_template,
+                    dir_custom=dir_custom,
+                    sample_metadata=get_sample_metadata(),
+                )
+            futures.append(submit("premise_excel_for_ontology", dir_xlsx, metadata_inputs))
+            futures.append(submit("premise_jsonld", dir_jsonld, metadata_inputs))
+        elif not metadata_done:
+            with instrumentation.stage("metadata_xlsx"):
+                dir_xlsx = merge_metadata_xlsx(
+                    dir_json, user_mapping=user_mapping, dir_template=dir_template,
+                    sample_metadata=get_sample_metadata(), dir_custom=dir_custom,
+                )
+            futures.append(submit("premise_excel_for_ontology", dir_xlsx, metadata_inputs))
+            with instrumentation.stage("jsonld"):
+                dir_jsonld = _gen_jsonld(dir_xlsx)
+            futures.append(submit("premise_jsonld", dir_jsonld, metadata_inputs))
+        for future in futures:
+            future.result()
+
+
+def push_many(
+        dir_pat: str,
+        folders: Iterable[str],
+        max_workers: int = 4,
+        openbis_obj: pybis.Openbis | None = None,
+        **kwargs: dict,
+) -> list[FolderPushReport]:
+    """Push several experiment folders concurrently, sharing one openBIS session.
+
+    A folder that fails to push is reported as failed without aborting the others.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        folders (Iterable[str]): Paths to the experiment folders to push.
+        max_workers (int, optional): Maximum number of folders pushed at the same time. Defaults to 4.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session to share between the pushes. If not
+            given, one is created from `dir_pat`.
+        **kwargs: Further keyword arguments passed on to `push_exp`.
+
+    Returns:
+        list[FolderPushReport]: One report per folder, in the order of `folders`.
+
+    """
+    from . import keller
+
+    ob = openbis_obj if openbis_obj is not None else keller.get_openbis_obj(dir_pat)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(partial(push_folder, dir_pat, openbis_obj=ob, **kwargs), folders))
+
+
+# Keyword arguments of `push_exp` that only apply to creating a new experiment.
+_PUSH_ONLY_PARAMETERS = ("experiment_type", "batch_properties", "resume")
+
+
+def experiment_exists(
+        openbis_obj: pybis.Openbis,
+        dir_folder: str | Path,
+        space_code: str = "TEST_SPACE_PYBIS",
+        project_code: str = "TEST_UPLOAD",
+) -> bool:
+    """Check if the experiment of a folder exists in openBIS, e.g. because it was pushed without an upload manifest.
+
+    Args:
+        openbis_obj (pybis.Openbis): An authenticated openBIS session.
+        dir_folder (str | Path): Path to the experiment folder.
+        space_code (str, optional): The openBIS space code. Defaults to 'TEST_SPACE_PYBIS'.
+        project_code (str, optional): The openBIS project code. Defaults to 'TEST_UPLOAD'.
+
+    Returns:
+        bool: Whether openBIS has an experiment with the identifier `push_exp` would create for the folder.
+
+    Raises:
+        ValueError: If the folder does not contain exactly one JSON file and one raw HDF5 file.
+
+    """
+    from . import keller
+
+    dir_json, _, _ = _find_push_files(Path(dir_folder))
+    ident = Identifiers(space_code, project_code, experiment_code=dir_json.stem.split(".")[1])
+    return keller.get_experiment_state(openbis_obj, ident.experiment_identifier.upper()) is not None
+
+
+def push_folder(
+        dir_pat: str,
+        folder: str | Path,
+        openbis_obj: pybis.Openbis | None = None,
+        update: bool = False,
+        **kwargs: dict,
+) -> FolderPushReport:
+    """Push one experiment folder with `push_exp`, reporting a failure instead of raising it.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        folder (str | Path): Path to the experiment folder.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session. If not given, one is created from
+            `dir_pat`.
+        update (bool, optional): Bring the already pushed experiment up to date with `update_exp` instead, ignoring
+            the keyword arguments that only apply to `push_exp`. Defaults to False.
+        **kwargs: Further keyword arguments passed on to `push_exp`.
+
+    Returns:
+        FolderPushReport: The result or the error of the push, with its metrics.
+
+    """
+    start = time.perf_counter()
+    metrics = PushMetrics()
+    try:
+        if update:
+            kwargs = {key: value for key, value in kwargs.items() if key not in _PUSH_ONLY_PARAMETERS}
+            result = update_exp(dir_pat, folder, openbis_obj=openbis_obj, metrics=metrics, **kwargs)
+        else:
+            result = push_exp(dir_pat, folder, openbis_obj=openbis_obj, metrics=metrics, **kwargs)
+    except Exception as e:
+        return FolderPushReport(
+            folder=str(folder),
+            duration=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+            metrics=metrics,
+        )
+    return FolderPushReport(
+        folder=str(folder), duration=time.perf_counter() - start, result=result, metrics=metrics,
+    )
+
+
+async def _run_in(executor: Executor | None, fn: Callable, *args: object) -> object:
+    """Run a blocking function in a thread pool executor, in a copy of the current context."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+
+async def push_exp_async(
+        dir_pat: str,
+        dir_folder: str,
+        user_mapping: dict | None = None,
+        dict_mapping: dict = pathfolio.dict_json_to_openbis,
+        space_code: str = "TEST_SPACE_PYBIS",
+        project_code: str = "TEST_UPLOAD",
+        experiment_type: str = "Battery_Premise3",
+        batch_properties: bool = True,
+        openbis_obj: pybis.Openbis | None = None,
+        resume: bool = True,
+        in_memory_metadata: bool = True,
+        stream_threshold: int | None = None,
+        progress_callback: Callable[[UploadProgress], None] | None = None,
+        dir_template: str = oh_my_ontology.DEFAULT_TEMPLATE,
+        metrics: PushMetrics | None = None,
+        network_executor: ThreadPoolExecutor | None = None,
+        local_executor: ThreadPoolExecutor | None = None,
+) -> PushResult:
+    """Push an experiment folder to openBIS from an event loop, like `push_exp` with `pipelined=True`.
+
+    pybis is blocking, so every call to openBIS runs in `network_executor` and the local file work, i.e. scanning
+    the folder and generating the metadata Excel and JSON-LD files, runs in `local_executor`. The size of the network
+    executor bounds the number of connections used, however many pushes share it. The raw data upload starts first
+    and runs while the metadata files are generated.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        dir_folder (str): Path to the directory containing the experimental data files.
+        user_mapping (dict, optional): A dictionary mapping short name codes to full names.
+        dict_mapping (dict, optional): A dictionary mapping JSON keys to openBIS codes.
+        space_code (str, optional): The openBIS space code. Defaults to 'TEST_SPACE_PYBIS'.
+        project_code (str, optional): The openBIS project code. Defaults to 'TEST_UPLOAD'.
+        experiment_type (str, optional): The openBIS experiment type. Defaults to 'Battery_Premise3'.
+        batch_properties (bool, optional): Write all metadata properties with a single save. Defaults to True.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session to reuse.
+        resume (bool, optional): Skip the stages a previous push already finished. Defaults to True.
+        in_memory_metadata (bool, optional): Build the JSON-LD in memory. Defaults to True.
+        stream_threshold (int, optional): Upload files of at least this many bytes in resumable chunks.
+        progress_callback (Callable[[UploadProgress], None], optional): Called with the progress of streamed uploads,
+            from a network executor thread.
+        dir_template (str, optional): The BattINFO template Excel file. Defaults to
+            `oh_my_ontology.DEFAULT_TEMPLATE`.
+        metrics (PushMetrics, optional): Collect the metrics of the push into this object.
+        network_executor (ThreadPoolExecutor, optional): The thread pool for the openBIS calls. Defaults to a new
+            pool of 4 threads, shut down after the push.
+        local_executor (ThreadPoolExecutor, optional): The thread pool for the local file work. Defaults to a new
+            pool of 1 thread, shut down after the push.
+
+    Raises:
+        ValueError: If the folder does not contain exactly one analyzed JSON file and one raw HDF5 file, or the JSON
+            file name does not follow the naming convention.
+        ValueError: If the manifest records a dataset that was uploaded from files that changed since.
+        ValueError: If the experiment is not recorded in the manifest and could not be created.
+
+    Returns:
+        PushResult: As for `push_exp`.
+
+    """
+    from . import keller
+
+    own_executors = []
+    if network_executor is None:
+        network_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="obvibe-network")
+        own_executors.append(network_executor)
+    if local_executor is None:
+        local_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="obvibe-local")
+        own_executors.append(local_executor)
+    run_network = partial(_run_in, network_executor)
+    run_local = partial(_run_in, local_executor)
+
+    metrics = metrics if metrics is not None else PushMetrics()
+    try:
+        with instrumentation.collect(metrics):
+            ob = openbis_obj if openbis_obj is not None else await run_network(keller.get_openbis_obj, dir_pat)
+            dir_json, dir_raw, dir_custom = await run_local(_find_push_files, Path(dir_folder))
+            exp_name = dir_json.stem.split(".")[1]  # Extract the experiment name from the json file name
+            ident = Identifiers(space_code, project_code, experiment_code=exp_name)
+
+            manifest = await run_local(UploadManifest.load, dir_folder) if resume else None
+            result = PushResult(experiment_identifier=ident.experiment_identifier.upper(), metrics=metrics)
+            metrics.experiment_identifier = result.experiment_identifier
+            get_sample_metadata = cache(partial(analyzed_json.read_sample_data, dir_json))
+            await run_network(
+                _push_properties,
+                ob, dir_json, get_sample_metadata, ident, manifest, result, dict_mapping, experiment_type,
+                batch_properties,
+            )
+
+            uploader = _DatasetUploader(
+                ob, ident, manifest, result, get_sample_metadata, stream_threshold, progress_callback,
+            )
+            await _upload_datasets_async(
+                uploader, dir_json, get_sample_metadata, dir_raw, dir_custom, user_mapping, in_memory_metadata,
+                dir_template, run_network, run_local,
+            )
+            return result
+    finally:
+        for executor in own_executors:
+            executor.shutdown(wait=False)
+
+
+async def _upload_datasets_async(
+        uploader: _DatasetUploader,
+        dir_json: Path,
+        get_sample_metadata: Callable[[], dict],
+        dir_raw: Path,
+        dir_custom: Path | None,
+        user_mapping: dict | None,
+        in_memory_metadata: bool,
+        dir_template: str,
+        run_network: Callable,
+        run_local: Callable,
+) -> None:
+    """Upload the datasets of an experiment as tasks while the local files are generated.
+
+    All uploads are awaited before returning, and the first upload error, if any, is raised.
+    """
+    uploads = [
+        asyncio.ensure_future(run_network(uploader.upload, "premise_cucumber_raw_battery_data", dir_raw, [dir_raw])),
+        asyncio.ensure_future(
+            run_network(uploader.upload, "premise_cucumber_analyzed_battery_data", dir_json, [dir_json]),
+        ),
+    ]
+    try:
+        metadata_inputs = await run_local(uploader.metadata_inputs, dir_custom)
+        metadata_done = await run_local(uploader.metadata_done, metadata_inputs)
+        if not metadata_done and in_memory_metadata:
+            with instrumentation.stage("metadata"):
+                # The sample data is read, if it was not already, in the worker rather than in the event loop.
+                dir_xlsx, dir_jsonld = await run_local(lambda: oh_my_ontology.gen_metadata_and_jsonld(
+                    dir_json,
+                    user_mapping=user_mapping,
+                    dir_template=dir_template,
+                    dir_custom=dir_custom,
+                    sample_metadata=get_sample_metadata(),
+                ))
+            uploads.append(asyncio.ensure_future(
+                run_network(uploader.upload, "premise_excel_for_ontology", dir_xlsx, metadata_inputs),
+            ))
+            uploads.append(asyncio.ensure_future(
+                run_network(uploader.upload, "premise_jsonld", dir_jsonld, metadata_inputs),
+            ))
+        elif not metadata_done:
+            with instrumentation.stage("metadata_xlsx"):
+                dir_xlsx = await run_local(lambda: merge_metadata_xlsx(
+                    dir_json, user_mapping=user_mapping, dir_template=dir_template,
+                    sample_metadata=get_sample_metadata(), dir_custom=dir_custom,
+                ))
+            uploads.append(asyncio.ensure_future(
+                run_network(uploader.upload, "premise_excel_for_ontology", dir_xlsx, metadata_inputs),
+            ))
+            with instrumentation.stage("jsonld"):
+                dir_jsonld = await run_local(_gen_jsonld, dir_xlsx)
+            uploads.append(asyncio.ensure_future(
+                run_network(uploader.upload, "premise_jsonld", dir_jsonld, metadata_inputs),
+            ))
+    finally:
+        outcomes = await asyncio.gather(*uploads, return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            raise outcome
+
+
+async def push_many_async(
+        dir_pat: str,
+        folders: Iterable[str],
+        max_concurrency: int = 64,
+        max_connections: int = 4,
+        max_local_workers: int = 2,
+        openbis_obj: pybis.Openbis | None = None,
+        **kwargs: dict,
+) -> list[FolderPushReport]:
+    """Push many experiment folders concurrently from an event loop, sharing one openBIS session.
+
+    Up to `max_concurrency` pushes are in progress at the same time, while their openBIS calls are multiplexed over
+    `max_connections` threads and their local file work over `max_local_workers` threads. A folder that fails to
+    push is reported as failed without aborting the others.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        folders (Iterable[str]): Paths to the experiment folders to push.
+        max_concurrency (int, optional): Maximum number of pushes in progress. Defaults to 64.
+        max_connections (int, optional): Maximum number of concurrent openBIS calls. Defaults to 4.
+        max_local_workers (int, optional): Maximum number of threads generating metadata files. Defaults to 2.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session to share between the pushes. If not
+            given, one is created from `dir_pat`.
+        **kwargs: Further keyword arguments passed on to `push_exp_async`.
+
+    Returns:
+        list[FolderPushReport]: One report per folder, in the order of `folders`.
+
+    """
+    from . import keller
+
+    network_executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="obvibe-network")
+    local_executor = ThreadPoolExecutor(max_workers=max_local_workers, thread_name_prefix="obvibe-local")
+    semaphore = asyncio.Semaphore(max_concurrency)
+    try:
+        ob = openbis_obj if openbis_obj is not None else await _run_in(
+            network_executor, keller.get_openbis_obj, dir_pat,
+        )
+
+        async def _push_one(folder: str) -> FolderPushReport:
+            async with semaphore:
+                start = time.perf_counter()
+                metrics = PushMetrics()
+                try:
+                    result = await push_exp_async(
+                        dir_pat,
+                        folder,
+                        openbis_obj=ob,
+                        metrics=metrics,
+                        network_executor=network_executor,
+                        local_executor=local_executor,
+                        **kwargs,
+                    )
+                except Exception as e:
+                    return FolderPushReport(
+                        folder=str(folder),
+                        duration=time.perf_counter() - start,
+                        error=f"{type(e).__name__}: {e}",
+                        metrics=metrics,
+                    )
+                return FolderPushReport(
+                    folder=str(folder), duration=time.perf_counter() - start, result=result, metrics=metrics,
+                )
 
-    # Upload the ontologized JSON-LD file to the openBIS
-    dir_jsonld = dir_folder / jsonld_filename
-    ds_jsonld = Dataset(ob, ident=ident)
-    ds_jsonld.type = "premise_jsonld"
-    ds_jsonld.data = dir_jsonld
-    ds_jsonld.upload_dataset()
+        return list(await asyncio.gather(*(_push_one(folder) for folder in folders)))
+    finally:
+        network_executor.shutdown(wait=False)
+        local_executor.shutdown(wait=False)
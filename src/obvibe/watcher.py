@@ -0,0 +1,317 @@
+"""Watch a directory for finished experiment folders and push them to openBIS.
+
+`FolderWatcher` polls the immediate subfolders of a root directory. A folder is pushed with `vibing.push_folder` once
+its analyzed JSON file and raw `full.*.h5` file are present and its input files have not changed for `settle_time`
+seconds, so files still being written by the cycler export are not uploaded half-done. Pushes run on a bounded pool
+of worker threads fed by a bounded queue; a folder is pushed again only after its input files change, or after
+`retry_interval` seconds if its push failed. A folder whose experiment exists in openBIS, as recorded by its upload
+manifest or, without a manifest, as found on the server, is pushed with `vibing.update_exp`, which replaces the
+datasets whose input files changed instead of adding new ones next to them. Folders that were already complete when
+the watcher started and whose experiment is not in openBIS are left alone unless `backfill` is set, so starting the
+watcher on an existing archive does not push all of it.
+
+Usage:
+    python -m obvibe.watcher /path/to/pat.txt /path/to/experiments --settle-time 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from . import vibing
+from .manifest import UploadManifest
+from .vibing import ExperimentFiles, FolderPushReport
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    import pybis
+
+logger = logging.getLogger(__name__)
+
+# (file name, size, modification time) of each input file of a folder.
+Signature = tuple[tuple[str, int, int], ...]
+
+
+@dataclass
+class _FolderState:
+    """What the watcher knows about one experiment folder."""
+
+    signature: Signature
+    stable_since: float
+    # Whether the files were already settled when the watcher started.
+    historical: bool = False
+    pushed_signature: Signature | None = None
+    failed_at: float | None = None
+    busy: bool = False
+
+
+def folder_signature(dir_folder: str | Path) -> tuple[Signature, float] | None:
+    """Get the signature of the input files of an experiment folder and their latest modification time.
+
+    Only the analyzed JSON, raw HDF5 and custom metadata files count, so the files generated by a push do not make a
+    pushed folder look changed.
+
+    Returns:
+        tuple[Signature, float] | None: The signature and the latest modification time in seconds, or None if the
+            folder does not have its analyzed JSON and raw HDF5 files yet.
+
+    """
+    files = ExperimentFiles.scan(dir_folder)
+    if not files.json_files or not files.raw_files:
+        return None
+    entries = []
+    for file in sorted(files.json_files + files.raw_files + files.custom_files):
+        try:
+            stat = file.stat()
+        except FileNotFoundError:
+            # Renamed or removed while scanning, look again on the next poll.
+            return None
+        entries.append((file.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(entries), max(mtime for _, _, mtime in entries) / 1e9
+
+
+def was_pushed(dir_folder: str | Path) -> bool:
+    """Check if the upload manifest of a folder records its experiment as created in openBIS."""
+    try:
+        return UploadManifest.load(dir_folder).is_done("experiment")
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read the upload manifest of %s: %s", dir_folder, e)
+        return False
+
+
+class FolderWatcher:
+    """Push the experiment folders of a root directory as they are completed.
+
+    Args:
+        dir_pat (str): Path to the openBIS PAT file (personal access token).
+        root (str | Path): The directory whose subfolders are experiment folders.
+        poll_interval (float, optional): Seconds between two scans of `root`. Defaults to 5.
+        settle_time (float, optional): Seconds the input files of a folder must stay unchanged before it is pushed.
+            Defaults to 30.
+        max_workers (int, optional): Maximum number of folders pushed at the same time. Defaults to 2.
+        max_queue (int, optional): Maximum number of folders waiting for a worker. Further ready folders are queued
+            on a later poll. Defaults to 100.
+        retry_interval (float, optional): Seconds before a folder whose push failed is pushed again, if its files
+            did not change in the meantime. Defaults to 600.
+        openbis_obj (pybis.Openbis, optional): An authenticated openBIS session shared by the pushes. If not given,
+            one is created from `dir_pat` when the watcher starts.
+        on_result (Callable[[FolderPushReport], None], optional): Called from the worker thread with the report of
+            every push. Exceptions it raises are logged.
+        backfill (bool, optional): Also push the folders that were already complete when the watcher started and
+            whose experiment is not in openBIS. Defaults to False, skipping them until their files change.
+        **push_kwargs: Further keyword arguments passed on to `vibing.push_exp`, and to `vibing.update_exp` except
+            those only `push_exp` takes.
+
+    """
+
+    def __init__(
+            self,
+            dir_pat: str,
+            root: str | Path,
+            poll_interval: float = 5.0,
+            settle_time: float = 30.0,
+            max_workers: int = 2,
+            max_queue: int = 100,
+            retry_interval: float = 600.0,
+            openbis_obj: pybis.Openbis | None = None,
+            on_result: Callable[[FolderPushReport], None] | None = None,
+            backfill: bool = False,
+            **push_kwargs: dict,
+    ) -> None:
+        self.dir_pat = dir_pat
+        self.root = Path(root)
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.max_workers = max_workers
+        self.retry_interval = retry_interval
+        self.openbis_obj = openbis_obj
+        self.on_result = on_result
+        self.backfill = backfill
+        self.push_kwargs = push_kwargs
+        self.folders: dict[Path, _FolderState] = {}
+        self._started_at: float | None = None
+        self._queue: queue.Queue[Path | None] = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers: list[threading.Thread] = []
+
+    def scan_once(self, now: float | None = None) -> list[Path]:
+        """Scan the root directory once and queue the folders that are ready to be pushed.
+
+        Args:
+            now (float, optional): The current time, as from `time.time`. Defaults to the actual time.
+
+        Returns:
+            list[Path]: The folders queued by this scan.
+
+        """
+        now = time.time() if now is None else now
+        if self._started_at is None:
+            self._started_at = now
+        queued = []
+        with os.scandir(self.root) as entries:
+            subfolders = [Path(entry.path) for entry in entries if entry.is_dir() and not entry.name.startswith(".")]
+        for folder in sorted(subfolders):
+            found = folder_signature(folder)
+            if found is None:
+                continue
+            signature, latest_mtime = found
+            historical = latest_mtime + self.settle_time <= self._started_at
+            with self._lock:
+                state = self.folders.get(folder)
+                if state is None:
+                    # Files already older than the settle time count as settled on the first scan.
+                    state = self.folders[folder] = _FolderState(signature, min(latest_mtime, now), historical)
+                elif state.signature != signature:
+                    state.signature = signature
+                    state.stable_since = now
+                    state.historical = historical
+                    state.failed_at = None
+                if not self._is_ready(state, now):
+                    continue
+                try:
+                    self._queue.put_nowait(folder)
+                except queue.Full:
+                    logger.debug("Push queue full, %s waits for the next scan", folder)
+                    break
+                state.busy = True
+            queued.append(folder)
+            logger.info("Queued %s", folder)
+        return queued
+
+    def _is_ready(self, state: _FolderState, now: float) -> bool:
+        if state.busy or now - state.stable_since < self.settle_time:
+            return False
+        if state.failed_at is not None:
+            return now - state.failed_at >= self.retry_interval
+        return state.signature != state.pushed_signature
+
+    def _work(self) -> None:
+        while (folder := self._queue.get()) is not None:
+            with self._lock:
+                signature = self.folders[folder].signature
+                historical = self.folders[folder].historical
+            report = self._push(folder, historical)
+            with self._lock:
+                state = self.folders[folder]
+                state.busy = False
+                if report is None:
+                    state.pushed_signature = signature
+                    continue
+                if report.ok:
+                    state.pushed_signature = signature
+                    state.failed_at = None
+                else:
+                    state.failed_at = time.time()
+            if report.ok:
+                logger.info("Pushed %s in %.1f s", folder, report.duration)
+            else:
+                logger.error("Failed to push %s: %s", folder, report.failure)
+            if self.on_result is not None:
+                try:
+                    self.on_result(report)
+                except Exception:
+                    logger.exception("on_result failed for %s", folder)
+
+    def _push(self, folder: Path, historical: bool) -> FolderPushReport | None:
+        """Push or update a folder depending on whether its experiment exists, or skip it and return None."""
+        update = was_pushed(folder)
+        if not update:
+            # Without a manifest, the folder may still have been pushed by an older version or another tool.
+            locations = {
+                key: value for key, value in self.push_kwargs.items() if key in ("space_code", "project_code")
+            }
+            try:
+                update = vibing.experiment_exists(self.openbis_obj, folder, **locations)
+            except Exception as e:
+                return FolderPushReport(folder=str(folder), duration=0.0, error=f"{type(e).__name__}: {e}")
+            if not update and historical and not self.backfill:
+                logger.info("Skipping %s, it was complete before the watcher started and is not in openBIS", folder)
+                return None
+        return vibing.push_folder(self.dir_pat, folder, openbis_obj=self.openbis_obj, update=update, **self.push_kwargs)
+
+    def start(self) -> None:
+        """Start the worker threads, connecting to openBIS first if no session was given."""
+        if self.openbis_obj is None:
+            from . import keller
+
+            self.openbis_obj = keller.get_openbis_obj(self.dir_pat)
+        self._stop.clear()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"obvibe-watcher-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def run(self) -> None:
+        """Scan the root directory every `poll_interval` seconds until `stop` is called."""
+        self.start()
+        try:
+            while not self._stop.is_set():
+                try:
+                    self.scan_once()
+                except OSError as e:
+                    logger.warning("Could not scan %s: %s", self.root, e)
+                self._stop.wait(self.poll_interval)
+        finally:
+            self.join()
+
+    def stop(self) -> None:
+        """Make `run` return after the current scan. Folders already queued are still pushed."""
+        self._stop.set()
+
+    def join(self) -> None:
+        """Wait for the queued pushes to finish and stop the worker threads."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+def main() -> None:
+    """Watch a directory from the command line until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("dir_pat", help="Path to the openBIS PAT file")
+    parser.add_argument("root", help="Directory whose subfolders are experiment folders")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds between two scans")
+    parser.add_argument("--settle-time", type=float, default=30.0, help="Seconds a folder must stay unchanged")
+    parser.add_argument("--workers", type=int, default=2, help="Folders pushed at the same time")
+    parser.add_argument("--max-queue", type=int, default=100, help="Folders waiting for a worker")
+    parser.add_argument("--retry-interval", type=float, default=600.0, help="Seconds before retrying a failed push")
+    parser.add_argument("--pipelined", action="store_true", help="Overlap metadata generation and uploads")
+    parser.add_argument(
+        "--backfill", action="store_true", help="Also push the folders complete at start that are not in openBIS",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    watcher = FolderWatcher(
+        args.dir_pat,
+        args.root,
+        poll_interval=args.poll_interval,
+        settle_time=args.settle_time,
+        max_workers=args.workers,
+        max_queue=args.max_queue,
+        retry_interval=args.retry_interval,
+        backfill=args.backfill,
+        pipelined=args.pipelined,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    main()
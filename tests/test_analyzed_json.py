@@ -0,0 +1,77 @@
+"""Tests for the incremental reading of the analyzed JSON files."""
+
+import json
+import math
+from pathlib import Path
+
+import pytest
+
+from obvibe.analyzed_json import read_sample_data
+
+
+def write_json(tmp_path: Path, content: object) -> Path:
+    path = tmp_path / "cycle.240906_kigr_gen4_01.json"
+    path.write_text(json.dumps(content))
+    return path
+
+
+def test_matches_json_load(tmp_path: Path) -> None:
+    content = {
+        "data": {"Cycle": list(range(1000)), "Voltage (V)": [3.5, 4.2, -1e-3]},
+        "metadata": {"provenance": {"version": "1.0"}, "sample_data": {"Sample ID": "240906_kigr_gen4_01", "N": 3}},
+    }
+    assert read_sample_data(write_json(tmp_path, content)) == content["metadata"]["sample_data"]
+
+
+def test_escaped_quotes(tmp_path: Path) -> None:
+    sample_data = {"Comment": 'Cell "A" with a backslash \\', 'Key "quoted"': '\\"', "Path": "C:\\data\\"}
+    content = {"data": {"Note": 'ends with \\"}'}, "metadata": {"sample_data": sample_data}}
+    assert read_sample_data(write_json(tmp_path, content)) == sample_data
+
+
+def test_braces_inside_strings(tmp_path: Path) -> None:
+    sample_data = {"Formula": "{[(Li)]}", "Open": "{{{", "Close": "]]}}"}
+    content = {
+        "data": {"Label": "}]} not the end", "metadata": "{"},
+        "metadata": {"note": "}", "sample_data": sample_data},
+    }
+    assert read_sample_data(write_json(tmp_path, content)) == sample_data
+
+
+def test_nan_and_infinity(tmp_path: Path) -> None:
+    content = {
+        "data": {"Capacity": [float("nan"), 1.0, float("inf")]},
+        "metadata": {"sample_data": {"Mass (mg)": float("nan"), "Limit": -float("inf"), "Flag": None, "Ok": True}},
+    }
+    sample_data = read_sample_data(write_json(tmp_path, content))
+    assert math.isnan(sample_data["Mass (mg)"])
+    assert sample_data["Limit"] == -float("inf")
+    assert sample_data["Flag"] is None
+    assert sample_data["Ok"] is True
+
+
+def test_nested_metadata_is_not_mistaken_for_the_section(tmp_path: Path) -> None:
+    sample_data = {"Sample ID": "top", "metadata": {"sample_data": {"Sample ID": "nested"}}}
+    content = {
+        "data": {"metadata": {"sample_data": {"Sample ID": "in data"}}},
+        "runs": [{"metadata": {"sample_data": {"Sample ID": "in a list"}}}],
+        "metadata": {"other": {"sample_data": {"Sample ID": "too deep"}}, "sample_data": sample_data},
+    }
+    assert read_sample_data(write_json(tmp_path, content)) == sample_data
+
+
+def test_custom_path(tmp_path: Path) -> None:
+    content = {"metadata": {"provenance": {"version": "1.0"}, "sample_data": {}}}
+    assert read_sample_data(write_json(tmp_path, content), ("metadata", "provenance")) == {"version": "1.0"}
+
+
+def test_missing_section(tmp_path: Path) -> None:
+    with pytest.raises(KeyError):
+        read_sample_data(write_json(tmp_path, {"data": {}, "metadata": {"job_data": {}}}))
+
+
+def test_empty_file(tmp_path: Path) -> None:
+    path = tmp_path / "cycle.empty.json"
+    path.write_text("")
+    with pytest.raises(json.JSONDecodeError):
+        read_sample_data(path)
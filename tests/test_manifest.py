@@ -0,0 +1,67 @@
+"""Tests for the upload manifest used to resume pushes."""
+
+import hashlib
+import os
+from pathlib import Path
+
+from obvibe.manifest import MANIFEST_NAME, UploadManifest, file_fingerprint
+
+
+def test_load_without_manifest(tmp_path: Path) -> None:
+    manifest = UploadManifest.load(tmp_path)
+    assert manifest.path == tmp_path / MANIFEST_NAME
+    assert manifest.experiment_identifier is None
+    assert not manifest.is_done("experiment")
+    assert not manifest.path.exists()
+
+
+def test_mark_done_is_saved_and_reloaded(tmp_path: Path) -> None:
+    manifest = UploadManifest.load(tmp_path)
+    manifest.experiment_identifier = "/TEST_SPACE_PYBIS/TEST_UPLOAD/240906_KIGR_GEN4_01"
+    manifest.mark_done("experiment")
+    manifest.mark_done("dataset:premise_jsonld", {"jsonld": "abc"}, perm_id="20240101000000000-1")
+
+    reloaded = UploadManifest.load(tmp_path)
+    assert reloaded.experiment_identifier == "/TEST_SPACE_PYBIS/TEST_UPLOAD/240906_KIGR_GEN4_01"
+    assert reloaded.is_done("experiment")
+    assert reloaded.stages["dataset:premise_jsonld"]["perm_id"] == "20240101000000000-1"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_is_done_compares_inputs(tmp_path: Path) -> None:
+    manifest = UploadManifest.load(tmp_path)
+    manifest.mark_done("properties", {"json": "abc"})
+    assert manifest.is_done("properties")
+    assert manifest.is_done("properties", {"json": "abc"})
+    assert not manifest.is_done("properties", {"json": "def"})
+    assert not manifest.is_done("dataset:premise_jsonld")
+
+
+def test_fingerprint_is_recorded_and_reused(tmp_path: Path) -> None:
+    path = tmp_path / "full.240906_kigr_gen4_01.h5"
+    path.write_bytes(b"raw data")
+    manifest = UploadManifest.load(tmp_path)
+    assert manifest.fingerprint(path) == hashlib.sha256(b"raw data").hexdigest()
+    assert manifest.files[path.name]["size"] == len(b"raw data")
+
+    # An unchanged size and modification time reuse the recorded hash without reading the file.
+    manifest.files[path.name]["sha256"] = "recorded"
+    assert manifest.fingerprint(path) == "recorded"
+
+
+def test_fingerprint_changes_with_the_file(tmp_path: Path) -> None:
+    path = tmp_path / "cycle.240906_kigr_gen4_01.json"
+    path.write_bytes(b"{}")
+    manifest = UploadManifest.load(tmp_path)
+    before = manifest.fingerprint(path)
+    path.write_bytes(b'{"a": 1}')
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert manifest.fingerprint(path) != before
+
+
+def test_file_fingerprint_with_changed_previous(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    path.write_bytes(b"content")
+    previous = {"size": 1, "mtime_ns": 0, "sha256": "stale"}
+    assert file_fingerprint(path, previous)["sha256"] == hashlib.sha256(b"content").hexdigest()
@@ -0,0 +1,88 @@
+"""Tests for the property diff used by `vibing.update_exp`."""
+
+import pytest
+
+from obvibe import vibing
+from obvibe.fake_openbis import FakeOpenbis
+from obvibe.vibing import _same_property_value, diff_properties
+
+
+@pytest.mark.parametrize(
+    ("current", "new"),
+    [
+        (None, None),
+        ("", None),
+        (None, ""),
+        ("abc", "abc"),
+        ("true", True),
+        ("FALSE", False),
+        ("3", 3),
+        ("3.0", 3),
+        ("0.1", 0.1),
+        ("1e-3", 0.001),
+    ],
+)
+def test_same_property_value(current: str | None, new: object) -> None:
+    assert _same_property_value(current, new)
+
+
+@pytest.mark.parametrize(
+    ("current", "new"),
+    [
+        ("abc", None),
+        (None, "abc"),
+        (None, 0),
+        ("abc", "ABC"),
+        ("true", False),
+        ("1", True),
+        ("3.5", 3),
+        ("n/a", 3),
+        ("3", "3.0"),
+    ],
+)
+def test_different_property_value(current: str | None, new: object) -> None:
+    assert not _same_property_value(current, new)
+
+
+def test_diff_properties() -> None:
+    dict_mapping = {"Sample ID": "sample_id", "Mass (mg)": "mass_mg", "Formation": "formation", "Missing": "missing"}
+    current = {"SAMPLE_ID": "240906_kigr_gen4_01", "MASS_MG": "12.0", "FORMATION": "true"}
+    sample_data = {"Sample ID": "240906_kigr_gen4_01", "Mass (mg)": 12.5, "Formation": True}
+    assert diff_properties(current, sample_data, dict_mapping) == {"mass_mg": 12.5}
+
+
+def test_diff_properties_clears_removed_values() -> None:
+    dict_mapping = {"Comment": "comment"}
+    assert diff_properties({"COMMENT": "old"}, {}, dict_mapping) == {"comment": None}
+    assert diff_properties({}, {}, dict_mapping) == {}
+
+
+def test_update_properties_writes_only_the_changes() -> None:
+    ob = FakeOpenbis()
+    experiment = ob.new_experiment(code="240906_kigr_gen4_01", type="Battery_Premise3", project="/SPACE/PROJECT")
+    experiment.p.update({"sample_id": "240906_kigr_gen4_01", "mass_mg": 12.0})
+    experiment.save()
+    ob.reset_calls()
+
+    dict_mapping = {"Sample ID": "sample_id", "Mass (mg)": "mass_mg"}
+    current = {"SAMPLE_ID": "240906_kigr_gen4_01", "MASS_MG": "12.0"}
+    identifier = experiment.identifier
+    result = vibing.update_properties(ob, identifier, current, {"Sample ID": "240906_kigr_gen4_01"}, dict_mapping)
+    assert result.uploaded == ["mass_mg"]
+    assert result.saved
+    assert ob.stats().by_method == {"updateExperiments": 1}
+    assert experiment.p["mass_mg"] is None
+
+    ob.reset_calls()
+    result = vibing.update_properties(ob, identifier, {"SAMPLE_ID": "240906_kigr_gen4_01"}, {}, dict_mapping)
+    assert result.uploaded == ["sample_id"]
+    assert ob.stats().by_method == {"updateExperiments": 1}
+
+
+def test_update_properties_without_changes() -> None:
+    ob = FakeOpenbis()
+    dict_mapping = {"Sample ID": "sample_id"}
+    result = vibing.update_properties(ob, "/SPACE/PROJECT/EXP", {"SAMPLE_ID": "a"}, {"Sample ID": "a"}, dict_mapping)
+    assert not result.uploaded
+    assert not result.saved
+    assert ob.stats().round_trips == 0